@@ -0,0 +1,262 @@
+"""
+Event-driven achievement engine. Routes emit domain events (upload,
+bookmark, download, ...) and return immediately; a background pass reads
+the affected users' counters from user_stats in one query, checks them
+against the declarative rules below and awards everything earned with one
+unordered bulk_write.
+
+Rules use >= so a threshold that was jumped past (two bookmarks landing in
+one pass, a buffered download batch) is still awarded.
+"""
+import os
+import uuid
+from datetime import datetime
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# All available achievements
+ACHIEVEMENTS = {
+    "first_bookmark": {
+        "name": "Bookworm",
+        "description": "Created your first bookmark",
+        "icon": "📚"
+    },
+    "bookmark_collector": {
+        "name": "Bookmark Collector",
+        "description": "Saved 10+ resources to bookmarks",
+        "icon": "⭐"
+    },
+    "bookmark_master": {
+        "name": "Bookmark Master",
+        "description": "Saved 25+ resources across different categories",
+        "icon": "💫"
+    },
+    "goal_setter": {
+        "name": "Goal Setter",
+        "description": "Set your first learning goal",
+        "icon": "🎯"
+    },
+    "goal_achiever": {
+        "name": "Goal Achiever",
+        "description": "Completed your first learning goal",
+        "icon": "🏆"
+    },
+    "goal_master": {
+        "name": "Goal Master",
+        "description": "Completed 5+ learning goals",
+        "icon": "👑"
+    },
+    "active_learner": {
+        "name": "Active Learner",
+        "description": "Downloaded 10+ resources",
+        "icon": "📖"
+    },
+    "power_user": {
+        "name": "Power User",
+        "description": "Downloaded 50+ resources",
+        "icon": "⚡"
+    },
+    "contributor": {
+        "name": "Contributor",
+        "description": "Uploaded your first resource",
+        "icon": "📝"
+    },
+    "super_contributor": {
+        "name": "Super Contributor",
+        "description": "Uploaded 5+ resources",
+        "icon": "🌟"
+    },
+    "profile_complete": {
+        "name": "Profile Complete",
+        "description": "Added profile photo and updated information",
+        "icon": "✨"
+    },
+    "early_adopter": {
+        "name": "Early Adopter",
+        "description": "One of the first users on the platform",
+        "icon": "🚀"
+    },
+    "forum_contributor": {
+        "name": "Forum Contributor",
+        "description": "Created your first forum post",
+        "icon": "💬"
+    }
+}
+
+# achievement -> (user_stats counter, minimum value)
+ACHIEVEMENT_RULES = {
+    "first_bookmark": ("bookmarks", 1),
+    "bookmark_collector": ("bookmarks", 10),
+    "bookmark_master": ("bookmarks", 25),
+    "goal_setter": ("goals", 1),
+    "goal_achiever": ("completed_goals", 1),
+    "goal_master": ("completed_goals", 5),
+    "active_learner": ("downloads", 10),
+    "power_user": ("downloads", 50),
+    "contributor": ("uploads", 1),
+    "super_contributor": ("uploads", 5),
+    "profile_complete": ("profile_photo", 1),
+    "forum_contributor": ("forum_posts", 1),
+}
+
+# early_adopter has no counter rule - it goes to the first EARLY_ADOPTER_COUNT
+# users by sign-up time, checked on their "register" event (and by
+# jobs.recompute_achievements)
+EARLY_ADOPTER_COUNT = int(os.getenv("EARLY_ADOPTER_COUNT", "100"))
+
+# Domain event -> counters it can move
+EVENTS = {
+    "upload": ["uploads"],
+    "bookmark": ["bookmarks"],
+    "download": ["downloads"],
+    "goal_created": ["goals"],
+    "goal_completed": ["completed_goals"],
+    "forum_post": ["forum_posts"],
+    "profile_photo": ["profile_photo"],
+    "register": ["signup"],
+}
+
+# Seconds between rule evaluation passes
+ACHIEVEMENT_INTERVAL = float(os.getenv("ACHIEVEMENT_INTERVAL", "1"))
+# Users whose counters and awarded set are kept in memory
+SNAPSHOT_CACHE_SIZE = int(os.getenv("ACHIEVEMENT_CACHE_SIZE", "50000"))
+AWARD_BATCH_SIZE = 1000
+
+
+def achievement_doc(user_id, achievement_type, earned_at=None):
+    achievement = ACHIEVEMENTS[achievement_type]
+    return {
+        "_id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "achievement_type": achievement_type,
+        "name": achievement["name"],
+        "description": achievement["description"],
+        "icon": achievement["icon"],
+        "earned_at": earned_at or datetime.utcnow()
+    }
+
+
+def earned(counters, counter_names=None):
+    """Achievement types whose rule `counters` satisfies (optionally only rules on `counter_names`)"""
+    return [
+        achievement_type
+        for achievement_type, (counter, threshold) in ACHIEVEMENT_RULES.items()
+        if (counter_names is None or counter in counter_names) and counters.get(counter, 0) >= threshold
+    ]
+
+
+async def insert_awards(db, docs):
+    """Insert award docs with unordered bulk_writes, skipping ones the user
+    already has; bumps user_stats.achievements and returns the docs actually inserted"""
+    inserted = []
+    for start in range(0, len(docs), AWARD_BATCH_SIZE):
+        batch = docs[start:start + AWARD_BATCH_SIZE]
+        try:
+            await db.achievements.bulk_write([InsertOne(doc) for doc in batch], ordered=False)
+            inserted += batch
+        except BulkWriteError as e:
+            # Duplicate (user_id, achievement_type) - already held
+            failed = {error["index"] for error in e.details["writeErrors"] if error["code"] == 11000}
+            if len(failed) != len(e.details["writeErrors"]):
+                raise
+            inserted += [doc for i, doc in enumerate(batch) if i not in failed]
+
+    per_user = {}
+    for doc in inserted:
+        per_user[doc["user_id"]] = per_user.get(doc["user_id"], 0) + 1
+    if per_user:
+        await db.user_stats.bulk_write([
+            UpdateOne({"_id": user_id}, {"$inc": {"achievements": count}}, upsert=True)
+            for user_id, count in per_user.items()
+        ], ordered=False)
+    return inserted
+
+
+async def early_adopters(db, user_ids):
+    """The `user_ids` among the first EARLY_ADOPTER_COUNT users by (created_at, _id)"""
+    if not user_ids:
+        return set()
+    last = None
+    async for user in db.users.find({}, {"created_at": 1}).sort(
+        [("created_at", 1), ("_id", 1)]
+    ).skip(EARLY_ADOPTER_COUNT - 1).limit(1):
+        last = (user["created_at"], user["_id"])
+    found = set()
+    async for user in db.users.find({"_id": {"$in": user_ids}}, {"created_at": 1}):
+        if last is None or (user["created_at"], user["_id"]) <= last:
+            found.add(user["_id"])
+    return found
+
+
+class AchievementEngine:
+    def __init__(self, db, cache_size=SNAPSHOT_CACHE_SIZE):
+        self.db = db
+        self.cache_size = cache_size
+        self.snapshots = {}     # user_id -> {"counters": {...}, "awarded": set()}
+        self._events = {}       # user_id -> counters touched since the last pass
+
+    def emit(self, user_id, event):
+        """Record a domain event; evaluated on the next process() pass"""
+        self._events.setdefault(user_id, set()).update(EVENTS[event])
+
+    async def process(self):
+        """Evaluate rules for every user with pending events; returns achievements awarded"""
+        events, self._events = self._events, {}
+        if not events:
+            return 0
+        try:
+            return await self._evaluate(events)
+        except Exception:
+            # Re-queue so the next pass retries these users
+            for user_id, counters in events.items():
+                self._events.setdefault(user_id, set()).update(counters)
+            raise
+
+    async def _evaluate(self, events):
+        user_ids = list(events)
+        # Counters are always re-read - other workers move them too
+        async for stats in self.db.user_stats.find({"_id": {"$in": user_ids}}):
+            self._snapshot(stats["_id"])["counters"] = stats
+
+        uncached = [user_id for user_id in user_ids if "awarded" not in self._snapshot(user_id)]
+        for user_id in uncached:
+            self.snapshots[user_id]["awarded"] = set()
+        if uncached:
+            async for row in self.db.achievements.find(
+                {"user_id": {"$in": uncached}},
+                {"user_id": 1, "achievement_type": 1}
+            ):
+                self.snapshots[row["user_id"]]["awarded"].add(row["achievement_type"])
+
+        docs = []
+        for user_id, counter_names in events.items():
+            snapshot = self.snapshots[user_id]
+            for achievement_type in earned(snapshot.get("counters", {}), counter_names):
+                if achievement_type not in snapshot["awarded"]:
+                    docs.append(achievement_doc(user_id, achievement_type))
+        signups = [
+            user_id for user_id, counter_names in events.items()
+            if "signup" in counter_names and "early_adopter" not in self.snapshots[user_id]["awarded"]
+        ]
+        for user_id in await early_adopters(self.db, signups):
+            docs.append(achievement_doc(user_id, "early_adopter"))
+
+        inserted = await insert_awards(self.db, docs)
+        for doc in docs:
+            # Inserted now or already held (awarded by another worker) - either way, done
+            self.snapshots[doc["user_id"]]["awarded"].add(doc["achievement_type"])
+        self._evict()
+        return len(inserted)
+
+    def _snapshot(self, user_id):
+        snapshot = self.snapshots.pop(user_id, None) or {}
+        # Re-insert so dict order is least recently used first
+        self.snapshots[user_id] = snapshot
+        return snapshot
+
+    def _evict(self):
+        while len(self.snapshots) > self.cache_size:
+            del self.snapshots[next(iter(self.snapshots))]
+
+    async def close(self):
+        await self.process()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+bcrypt benchmark - measures hash time for each cost on this machine, the
+cost calibration would pick for BCRYPT_TARGET_MS, and hashes per second
+on one thread and on one thread per core (bcrypt releases the GIL, so
+the pool should scale with the core count).
+
+Usage: python benchmarks/bcrypt_cost.py [rounds] [seconds]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from passlib.hash import bcrypt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from password_hashing import time_hash, calibrate_rounds, BCRYPT_TARGET_MS, BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS
+
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+CORES = os.cpu_count() or 1
+
+def hashes_per_second(rounds, threads):
+    handler = bcrypt.using(rounds=rounds)
+    deadline = time.perf_counter() + SECONDS
+
+    def work(_):
+        count = 0
+        while time.perf_counter() < deadline:
+            handler.hash("benchmark")
+            count += 1
+        return count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        total = sum(pool.map(work, range(threads)))
+    return total / (time.perf_counter() - started)
+
+if __name__ == "__main__":
+    for rounds in range(BCRYPT_MIN_ROUNDS, min(BCRYPT_MAX_ROUNDS, 14) + 1):
+        print(f"  {rounds} rounds: {time_hash(rounds) * 1000:7.1f} ms/hash")
+
+    calibrated = calibrate_rounds()
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else calibrated
+    print(f"Calibration picks {calibrated} rounds for a {BCRYPT_TARGET_MS:.0f} ms target")
+
+    single = hashes_per_second(rounds, 1)
+    pooled = hashes_per_second(rounds, CORES)
+    print(f"{rounds} rounds, {CORES} cores, {SECONDS:.0f}s per run")
+    print(f"  1 thread:       {single:.2f} hashes/s")
+    print(f"  {CORES} threads:      {pooled:.2f} hashes/s ({pooled / CORES:.2f} hashes/s per core)")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Conditional GET / Range benchmark - serves a PDF through file_response (the
+helper behind the view and download routes) and counts the body bytes sent
+for a reader who opens it repeatedly, with and without sending back the
+ETag, and for a PDF.js-style viewer that fetches only the pages it shows
+instead of the whole file.
+
+Usage: python benchmarks/conditional_get.py [file_mb] [repeat_views] [pages_viewed]
+"""
+import os
+import sys
+import asyncio
+import tempfile
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_delivery import file_response
+
+FILE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+VIEWS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+PAGES = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+# PDF.js fetches in 64 KB chunks by default
+RANGE_CHUNK = 64 * 1024
+
+def make_app(path):
+    async def view(request):
+        return await file_response(request, path, "application/pdf", disposition="inline")
+    return Starlette(routes=[Route("/view", view)])
+
+async def repeat_views(client, revalidate):
+    sent = 0
+    etag = None
+    for _ in range(VIEWS):
+        headers = {"If-None-Match": etag} if revalidate and etag else {}
+        response = await client.get("/view", headers=headers)
+        etag = response.headers["etag"]
+        sent += len(response.content)
+    return sent
+
+async def lazy_pages(client, size):
+    """Trailer and xref first, then one range per page viewed, spread through the file"""
+    sent = len((await client.get("/view", headers={"Range": f"bytes=-{RANGE_CHUNK}"})).content)
+    for page in range(PAGES):
+        start = (size // (PAGES + 1)) * page
+        response = await client.get("/view", headers={"Range": f"bytes={start}-{start + RANGE_CHUNK - 1}"})
+        assert response.status_code == 206
+        sent += len(response.content)
+    return sent
+
+async def main(path, size):
+    transport = httpx.ASGITransport(app=make_app(path))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for label, sent in (
+            (f"{VIEWS} views, no validators", await repeat_views(client, revalidate=False)),
+            (f"{VIEWS} views, If-None-Match", await repeat_views(client, revalidate=True)),
+            (f"{PAGES} pages, whole file", size),
+            (f"{PAGES} pages, by range", await lazy_pages(client, size)),
+        ):
+            print(f"  {label:28} {sent / 1e6:9.2f} MB")
+
+if __name__ == "__main__":
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+        f.write(os.urandom(FILE_MB * 1024 * 1024))
+        f.flush()
+        print(f"{FILE_MB} MB PDF")
+        asyncio.run(main(f.name, FILE_MB * 1024 * 1024))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+File offload benchmark - serves a PDF through file_response (the helper
+behind the view, download and profile photo routes) straight from the
+worker, and through a stub proxy that sets X-Sendfile-Type and resolves
+X-Accel-Redirect from disk the way nginx's internal location would. Reports
+the bytes and time the worker spends per download in each mode and checks
+that the client gets the same bytes, ranges included.
+
+Point FILE_DELIVERY/UPLOAD_DIR at a real nginx to try the same thing end to end.
+
+Usage: python benchmarks/file_offload.py [file_mb] [downloads]
+"""
+import os
+import sys
+import time
+import asyncio
+import shutil
+import tempfile
+from urllib.parse import unquote
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+UPLOAD_DIR = tempfile.mkdtemp()
+os.environ["UPLOAD_DIR"] = UPLOAD_DIR
+os.environ["FILE_DELIVERY"] = "x-accel-redirect"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_delivery import file_response, X_ACCEL_PREFIX
+
+FILE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+DOWNLOADS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+async def download(request):
+    name = request.path_params["name"]
+    return await file_response(request, os.path.join(UPLOAD_DIR, name), "application/pdf", filename=name)
+
+worker = Starlette(routes=[Route("/files/{name}", download)])
+worker_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=worker), base_url="http://worker")
+worker_stats = {"bytes": 0, "seconds": 0.0}
+
+async def call_worker(path, headers=None):
+    started = time.perf_counter()
+    response = await worker_client.get(path, headers=headers)
+    worker_stats["seconds"] += time.perf_counter() - started
+    worker_stats["bytes"] += len(response.content)
+    return response
+
+async def proxy(request):
+    """Stand-in for nginx: forward to the worker, then serve any internal redirect itself"""
+    headers = {**request.headers, "x-sendfile-type": "X-Accel-Redirect"}
+    upstream = await call_worker(request.url.path, headers)
+    target = upstream.headers.get("x-accel-redirect")
+    if not target:
+        return Response(upstream.content, upstream.status_code, headers=upstream.headers)
+    path = os.path.join(UPLOAD_DIR, unquote(target[len(X_ACCEL_PREFIX):]))
+    # The proxy's own request has no X-Sendfile-Type, so this streams from disk
+    return await file_response(
+        request, path, upstream.headers["content-type"],
+        disposition=upstream.headers["content-disposition"],
+        cache_control=upstream.headers["cache-control"]
+    )
+
+async def run(label, get, data):
+    worker_stats.update(bytes=0, seconds=0.0)
+    for _ in range(DOWNLOADS):
+        response = await get("/files/paper.pdf")
+        assert response.content == data
+    ranged = await get("/files/paper.pdf", headers={"Range": "bytes=100-199"})
+    assert ranged.status_code == 206 and ranged.content == data[100:200]
+    print(f"  {label:8} worker sent {worker_stats['bytes'] / (DOWNLOADS + 1) / 1e6:7.2f} MB "
+          f"in {worker_stats['seconds'] / (DOWNLOADS + 1) * 1000:7.1f} ms per request")
+
+async def main(data):
+    proxied = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=Starlette(routes=[Route("/files/{name}", proxy)])),
+        base_url="http://proxy"
+    )
+    await run("direct", call_worker, data)
+    await run("x-accel", proxied.get, data)
+    await proxied.aclose()
+    await worker_client.aclose()
+
+if __name__ == "__main__":
+    data = os.urandom(FILE_MB * 1024 * 1024)
+    with open(os.path.join(UPLOAD_DIR, "paper.pdf"), "wb") as f:
+        f.write(data)
+    print(f"{DOWNLOADS} downloads of a {FILE_MB} MB PDF, plus one range request")
+    try:
+        asyncio.run(main(data))
+    finally:
+        shutil.rmtree(UPLOAD_DIR)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Search benchmark - builds a SearchIndex over synthetic resource rows and
+reports build time plus per-query latency percentiles.
+
+Usage: python benchmarks/search.py [docs] [queries]
+"""
+import os
+import sys
+import time
+import random
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search_index import SearchIndex
+
+DOCS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+QUERIES = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+BRANCHES = ["Computer Science", "Electronics", "Mechanical", "Civil", "Information Science"]
+KINDS = ["paper", "note", "syllabus"]
+
+random.seed(42)
+# Zipf-ish vocabulary: a few very common subject words and a long tail
+VOCAB = [f"term{i}" for i in range(20000)]
+WEIGHTS = [1 / (i + 1) for i in range(len(VOCAB))]
+SUBJECTS = ["dbms", "algorithms", "networks", "compiler", "thermodynamics", "signals",
+            "structures", "surveying", "java", "python", "react", "microprocessor"]
+
+def make_row(i):
+    words = random.choices(VOCAB, WEIGHTS, k=12)
+    return {
+        "id": str(uuid.uuid4()),
+        "title": f"{random.choice(SUBJECTS)} {' '.join(words[:3])} {2015 + i % 10}",
+        "branch": random.choice(BRANCHES),
+        "description": " ".join(words[3:]),
+        "tags": random.sample(SUBJECTS, 2),
+    }
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+if __name__ == "__main__":
+    rows = [(random.choice(KINDS), make_row(i), None) for i in range(DOCS)]
+    
+    index = SearchIndex()
+    started = time.perf_counter()
+    index.add_many(rows)
+    print(f"Indexed {len(index)} docs in {time.perf_counter() - started:.2f}s")
+    
+    queries = []
+    for _ in range(QUERIES):
+        shape = random.random()
+        if shape < 0.4:
+            queries.append(random.choice(SUBJECTS))
+        elif shape < 0.8:
+            queries.append(f"{random.choice(SUBJECTS)} {random.choice(VOCAB[:500])}")
+        else:
+            queries.append(f"{random.choice(SUBJECTS)} {2015 + random.randrange(10)} {random.choice(BRANCHES)}")
+    
+    # Incremental updates, as uploads and deletes would apply them
+    started = time.perf_counter()
+    for doc_type, row, _ in rows[:200]:
+        index.remove(doc_type, row["id"])
+        index.add(doc_type, row)
+    print(f"Incremental remove+add: {(time.perf_counter() - started) / 200 * 1000:.3f} ms per doc")
+    
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, limit=20)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    print(f"{QUERIES} queries, top 20: p50 {percentile(latencies, 0.5):.3f} ms, "
+          f"p95 {percentile(latencies, 0.95):.3f} ms, p99 {percentile(latencies, 0.99):.3f} ms")
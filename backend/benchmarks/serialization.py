@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Serialization micro-benchmark - rows per second for a resource list built
+the old way (one PaperResponse per row, then FastAPI's response_model
+validate + jsonable + json.dumps) vs the fast path in serialization.py.
+
+Usage: python benchmarks/serialization.py [rows]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+from pydantic import BaseModel, TypeAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serialization import FastJSONResponse, resource_row
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+# Mirrors server.PaperResponse (importing server would need a live config)
+class PaperResponse(BaseModel):
+    title: str
+    branch: str
+    description: Optional[str] = None
+    tags: List[str] = []
+    id: str
+    file_path: str
+    uploaded_by: str
+    created_at: datetime
+
+def make_docs(count):
+    now = datetime.utcnow()
+    return [{
+        "_id": str(uuid.uuid4()),
+        "title": f"Question paper {i}",
+        "branch": "Computer Science",
+        "description": "End semester examination paper",
+        "tags": ["dbms", "2024", "sem5"],
+        "file_path": f"uploads/papers/{uuid.uuid4()}-paper.pdf",
+        "uploaded_by": str(uuid.uuid4()),
+        "created_at": now - timedelta(minutes=i),
+    } for i in range(count)]
+
+def model_path(docs, adapter):
+    papers = [PaperResponse(
+        id=doc["_id"],
+        title=doc["title"],
+        branch=doc["branch"],
+        description=doc.get("description", ""),
+        tags=doc.get("tags", []),
+        file_path=doc["file_path"],
+        uploaded_by=doc["uploaded_by"],
+        created_at=doc["created_at"]
+    ) for doc in docs]
+    # What FastAPI does with response_model=List[PaperResponse]
+    content = [paper.model_dump() for paper in papers]
+    validated = adapter.validate_python(content)
+    return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+def fast_path(docs):
+    return FastJSONResponse([resource_row(doc) for doc in docs]).body
+
+def timed(fn, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+if __name__ == "__main__":
+    docs = make_docs(ROWS)
+    adapter = TypeAdapter(List[PaperResponse])
+    
+    assert json.loads(model_path(docs, adapter)) == json.loads(fast_path(docs))
+    
+    slow = timed(model_path, docs, adapter)
+    fast = timed(fast_path, docs)
+    print(f"{ROWS} rows (best of 5)")
+    print(f"  pydantic + response_model: {ROWS / slow:>12,.0f} rows/s")
+    print(f"  fast path (orjson):        {ROWS / fast:>12,.0f} rows/s")
+    print(f"  speedup:                   {slow / fast:>12.1f}x")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Unique-viewer benchmark - simulates views on forum posts from a pool of
+viewers and compares HyperLogLog estimates with exact distinct counts.
+Reports sketch memory against exact per-post sets, estimate error
+percentiles, and add / merge / count costs.
+
+Usage: python benchmarks/unique_viewers.py [posts] [viewers]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hyperloglog import HyperLogLog, M, hash_key
+
+POSTS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+VIEWERS = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+rng = np.random.default_rng(42)
+
+def percentile(values, p):
+    return float(np.percentile(values, p))
+
+def exact_set_bytes(keys):
+    """Memory of a Python set of viewer key strings (what an exact counter would keep)"""
+    viewers = set(keys)
+    return sys.getsizeof(viewers) + sum(sys.getsizeof(key) for key in viewers)
+
+if __name__ == "__main__":
+    keys = [f"user:{i:08d}" for i in range(VIEWERS)]
+    started = time.perf_counter()
+    hashes = np.array([hash_key(key) for key in keys], dtype=np.uint64)
+    hash_us = (time.perf_counter() - started) / VIEWERS * 1e6
+
+    # Heavy-tailed views per post: most posts get a few dozen views, a few get
+    # more views than there are viewers
+    views_per_post = np.minimum((rng.pareto(1.1, POSTS) + 1) * 20, VIEWERS * 3).astype(np.int64)
+
+    sketches = []
+    errors = []
+    exact_total = 0
+    sampled_set_bytes = []
+    seen = np.zeros(VIEWERS, dtype=bool)
+    started = time.perf_counter()
+    for post, views in enumerate(views_per_post):
+        viewers = rng.integers(0, VIEWERS, views)
+        sketch = HyperLogLog()
+        sketch.add_hashes(hashes[viewers])
+        sketches.append(sketch)
+        seen[viewers] = True
+
+        exact = len(np.unique(viewers))
+        exact_total += exact
+        errors.append(abs(sketch.count() - exact) / exact)
+        if post % 100 == 0:
+            sampled_set_bytes.append((exact, exact_set_bytes(keys[i] for i in viewers)))
+    build_s = time.perf_counter() - started
+    errors = np.array(errors) * 100
+
+    # Scale the sampled exact-set cost (bytes per distinct viewer) to every post
+    bytes_per_viewer = sum(b for _, b in sampled_set_bytes) / sum(n for n, _ in sampled_set_bytes)
+    exact_mb = exact_total * bytes_per_viewer / 1e6
+    sketch_mb = POSTS * M / 1e6
+
+    started = time.perf_counter()
+    total = HyperLogLog()
+    for sketch in sketches:
+        total.merge(sketch)
+    merge_us = (time.perf_counter() - started) / POSTS * 1e6
+
+    started = time.perf_counter()
+    for sketch in sketches[:1000]:
+        sketch.count()
+    count_us = (time.perf_counter() - started) / min(POSTS, 1000) * 1e6
+
+    single = HyperLogLog()
+    started = time.perf_counter()
+    for key in keys[:20000]:
+        single.add(key)
+    add_us = (time.perf_counter() - started) / 20000 * 1e6
+
+    print(f"{POSTS} posts, {VIEWERS} viewers, {int(views_per_post.sum())} views, {exact_total} distinct post/viewer pairs")
+    print(f"Memory: sketches {sketch_mb:.1f} MB ({M} B/post) vs exact sets {exact_mb:.1f} MB")
+    print(f"Error %: mean {errors.mean():.2f}, p50 {percentile(errors, 50):.2f}, "
+          f"p95 {percentile(errors, 95):.2f}, p99 {percentile(errors, 99):.2f}, max {errors.max():.2f}")
+    big = views_per_post >= 10000
+    if big.any():
+        print(f"Error % on {int(big.sum())} posts with 10k+ views: mean {errors[big].mean():.2f}, max {errors[big].max():.2f}")
+    print(f"Union of all posts: estimate {total.count()}, exact {int(seen.sum())}")
+    print(f"Costs: add {add_us:.2f} us/view (hash {hash_us:.2f}), merge {merge_us:.2f} us, count {count_us:.2f} us")
+    print(f"Simulation time {build_s:.1f}s")
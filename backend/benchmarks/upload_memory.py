@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Upload memory benchmark - saves concurrent uploads the way the multipart
+parser hands them to routes (spooled temp files) and reports peak Python
+heap while saving, for the old read-everything writer and the streaming
+writer in file_storage.py. Streaming peak should be about one chunk per
+upload however large the files are.
+
+Usage: python benchmarks/upload_memory.py [file_mb] [concurrent_uploads]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import tracemalloc
+import aiofiles
+from starlette.datastructures import UploadFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_storage import stream_to_file, UPLOAD_CHUNK_SIZE
+
+FILE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 80
+UPLOADS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+async def read_all(upload_file, file_path):
+    """The previous save_upload_file body"""
+    async with aiofiles.open(file_path, 'wb') as f:
+        content = await upload_file.read()
+        await f.write(content)
+
+async def stream(upload_file, file_path):
+    await stream_to_file(upload_file, file_path, max_bytes=float("inf"))
+
+def spooled_upload(data):
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    for start in range(0, len(data), UPLOAD_CHUNK_SIZE):
+        spool.write(data[start:start + UPLOAD_CHUNK_SIZE])
+    spool.seek(0)
+    return UploadFile(spool, filename="paper.pdf")
+
+async def run(writer, data, out_dir):
+    uploads = [spooled_upload(data) for _ in range(UPLOADS)]
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        writer(upload, os.path.join(out_dir, f"{writer.__name__}-{i}.pdf"))
+        for i, upload in enumerate(uploads)
+    ])
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for upload in uploads:
+        await upload.close()
+    return peak, elapsed
+
+if __name__ == "__main__":
+    data = os.urandom(FILE_MB * 1024 * 1024)
+    print(f"{UPLOADS} concurrent uploads of {FILE_MB} MB, {UPLOAD_CHUNK_SIZE // 1024} KB chunks")
+    with tempfile.TemporaryDirectory() as out_dir:
+        for writer in (read_all, stream):
+            peak, elapsed = asyncio.run(run(writer, data, out_dir))
+            print(f"  {writer.__name__:8} peak heap {peak / 1e6:8.1f} MB "
+                  f"({peak / UPLOADS / 1e6:.1f} MB per upload), {elapsed:.2f}s")
@@ -0,0 +1,195 @@
+"""
+Content-addressed store for uploaded PDFs. Each distinct file is kept once
+under UPLOAD_DIR/blobs/<sha256[:2]>/<sha256> however many papers, notes or
+syllabus docs point at it. The blobs collection holds a reference count
+per sha256; a blob is unlinked when its last reference is released.
+
+Releasing the last reference and a new upload of the same content can
+race across workers, so the releaser moves the file aside first and puts
+it back if an upload re-created the blob meanwhile.
+"""
+import os
+import uuid
+import asyncio
+import shutil
+import hashlib
+import aiofiles.os
+from datetime import datetime
+from pymongo import ReturnDocument
+from file_storage import stream_to_file, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE
+
+BLOB_DIR = os.path.join(os.getenv("UPLOAD_DIR", "uploads"), "blobs")
+BLOB_COLLECTIONS = ["papers", "notes", "syllabus"]
+
+
+def blob_path(sha256):
+    return os.path.join(BLOB_DIR, sha256[:2], sha256)
+
+
+def is_blob(doc):
+    return bool(doc.get("file_sha256")) and doc.get("file_path") == blob_path(doc["file_sha256"])
+
+
+def hash_file(path):
+    """(sha256 hex, size) of a file on disk"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def link_or_copy(source_path, target_path):
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+
+async def add_ref(db, source_path, sha256, size):
+    """Take a reference on blob `sha256`, moving `source_path` into the store if
+    it doesn't hold that content yet; returns the blob path"""
+    path = blob_path(sha256)
+    existing = await db.blobs.find_one_and_update(
+        {"_id": sha256},
+        {"$inc": {"refs": 1}, "$setOnInsert": {"size": size, "created_at": datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    if existing is None or not await aiofiles.os.path.exists(path):
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        await aiofiles.os.replace(source_path, path)
+    return path
+
+
+async def store_upload(db, upload_file, max_bytes=MAX_UPLOAD_BYTES):
+    """Stream `upload_file` into the store and take a reference on it;
+    returns (path, sha256, size)"""
+    await aiofiles.os.makedirs(BLOB_DIR, exist_ok=True)
+    incoming = os.path.join(BLOB_DIR, f"incoming-{uuid.uuid4().hex}")
+    sha256, size = await stream_to_file(upload_file, incoming, max_bytes)
+    try:
+        path = await add_ref(db, incoming, sha256, size)
+    finally:
+        # Still here if the store already had this content
+        try:
+            await aiofiles.os.remove(incoming)
+        except OSError:
+            pass
+    return path, sha256, size
+
+
+async def store_file(db, source_path):
+    """Link (or copy) a finished file, e.g. a completed resumable upload, into the
+    store and take a reference on it; returns (path, sha256, size). `source_path`
+    is left in place so the caller can still retry until the doc is saved."""
+    sha256, size = await asyncio.to_thread(hash_file, source_path)
+    await aiofiles.os.makedirs(BLOB_DIR, exist_ok=True)
+    incoming = os.path.join(BLOB_DIR, f"incoming-{uuid.uuid4().hex}")
+    await asyncio.to_thread(link_or_copy, source_path, incoming)
+    try:
+        path = await add_ref(db, incoming, sha256, size)
+    finally:
+        # Still here if the store already had this content
+        try:
+            await aiofiles.os.remove(incoming)
+        except OSError:
+            pass
+    return path, sha256, size
+
+
+async def release(db, sha256):
+    """Drop one reference; unlinks the blob if it was the last. Returns True if unlinked"""
+    blob = await db.blobs.find_one_and_update(
+        {"_id": sha256},
+        {"$inc": {"refs": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if blob is None or blob["refs"] > 0:
+        return False
+    result = await db.blobs.delete_one({"_id": sha256, "refs": {"$lte": 0}})
+    if not result.deleted_count:
+        return False  # re-referenced in between
+
+    path = blob_path(sha256)
+    tombstone = f"{path}.deleted-{uuid.uuid4().hex}"
+    try:
+        await aiofiles.os.replace(path, tombstone)
+    except FileNotFoundError:
+        return True
+    # An upload of the same content may have re-created the blob while we were
+    # deleting it - hand the file back rather than leave that doc without one
+    if await db.blobs.find_one({"_id": sha256}, {"_id": 1}) and not await aiofiles.os.path.exists(path):
+        await aiofiles.os.replace(tombstone, path)
+        return False
+    await aiofiles.os.remove(tombstone)
+    return True
+
+
+async def release_file(db, doc):
+    """Give up a resource doc's file - a blob reference, or a pre-blob-store file"""
+    if is_blob(doc):
+        return await release(db, doc["file_sha256"])
+    try:
+        os.remove(doc["file_path"])
+    except OSError:
+        pass  # might be missing, that's ok
+    return True
+
+
+async def move_files_to_blobs(db):
+    """Move per-upload files of papers/notes/syllabus into the blob store.
+    The reference is taken before the doc is repointed, so a crash part way
+    can leak a blob but never leave a doc without its file."""
+    moved = 0
+    freed = 0
+    for collection_name in BLOB_COLLECTIONS:
+        collection = db[collection_name]
+        async for doc in collection.find({}, {"file_path": 1, "file_sha256": 1}):
+            if is_blob(doc) or not os.path.exists(doc["file_path"]):
+                continue
+            sha256, size = await asyncio.to_thread(hash_file, doc["file_path"])
+            path = blob_path(sha256)
+            if await aiofiles.os.path.exists(path):
+                freed += size
+            else:
+                # Copy, not move - the doc still points at the original until repointed
+                await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+                staged = f"{path}.{uuid.uuid4().hex}.part"
+                await asyncio.to_thread(link_or_copy, doc["file_path"], staged)
+                await aiofiles.os.replace(staged, path)
+            await add_ref(db, path, sha256, size)
+            # Only repoint a doc still at its old file, so a second run over the
+            # same doc hands its extra reference back instead of keeping it
+            result = await collection.update_one(
+                {"_id": doc["_id"], "file_path": doc["file_path"]},
+                {"$set": {"file_path": path, "file_sha256": sha256, "file_size": size}}
+            )
+            if not result.matched_count:
+                await release(db, sha256)
+                continue
+            try:
+                os.remove(doc["file_path"])
+            except OSError:
+                pass
+            moved += 1
+    if moved:
+        print(f"✓ Moved {moved} uploads into the blob store ({freed / 1e6:.1f} MB of duplicates freed)")
+    return {"moved": moved, "freed_bytes": freed}
+
+
+async def blob_report(db):
+    """Blob count, bytes on disk and bytes the referencing docs would take without dedup"""
+    report = {"blobs": 0, "stored_bytes": 0, "referenced_bytes": 0}
+    async for row in db.blobs.aggregate([
+        {"$group": {
+            "_id": None,
+            "blobs": {"$sum": 1},
+            "stored_bytes": {"$sum": "$size"},
+            "referenced_bytes": {"$sum": {"$multiply": ["$size", "$refs"]}}
+        }}
+    ]):
+        report = {key: row[key] for key in report}
+    return report
@@ -40,6 +40,8 @@ def create_your_admin():
                     {"_id": admin["_id"]},
                     {"$set": {"is_admin": True}}
                 )
+                # Running API workers drop their cached copy of this user
+                db.user_cache_invalidations.insert_one({"user_id": admin["_id"], "at": datetime.utcnow()})
                 print("✓ Updated admin privileges")
             return True
         
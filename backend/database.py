@@ -0,0 +1,40 @@
+"""
+Async data-access layer - every route talks to MongoDB through these
+Motor collections so a slow query never blocks the event loop
+"""
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL")
+DATABASE_NAME = os.getenv("DATABASE_NAME")
+# Upper bound on pooled connections per worker (Motor default is 100)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+
+# Motor connects lazily, so creating the client here never blocks import
+client = AsyncIOMotorClient(MONGO_URL, maxPoolSize=MONGO_MAX_POOL_SIZE)
+db = client[DATABASE_NAME]
+
+# All collections we need
+users_collection = db.users
+papers_collection = db.papers
+notes_collection = db.notes
+syllabus_collection = db.syllabus
+chat_messages_collection = db.chat_messages
+bookmarks_collection = db.bookmarks
+achievements_collection = db.achievements
+learning_goals_collection = db.learning_goals
+downloads_collection = db.downloads  # Track actual downloads
+forum_posts_collection = db.forum_posts  # Forum posts
+forum_replies_collection = db.forum_replies  # Forum replies
+user_stats_collection = db.user_stats  # Materialized per-user counters
+resource_chunks_collection = db.resource_chunks  # Text extracted from uploaded PDFs
+counters_collection = db.counters  # Site-wide totals for /api/stats, one doc per metric
+user_cache_invalidations_collection = db.user_cache_invalidations  # Users each worker must drop from its auth cache
+
+
+async def ping():
+    """Round trip to the server - raises if MongoDB is unreachable"""
+    return await client.admin.command('ping')
@@ -0,0 +1,94 @@
+"""
+Write-behind buffer for download events. Download routes only append to an
+in-process queue; batches go to Mongo with one insert_many plus one bulk
+$inc on user_stats, either when the queue reaches DOWNLOAD_BATCH_SIZE or on
+the periodic flush. The flushed user ids are then handed to on_flushed
+(the achievement engine) - their counters are only current from there on.
+
+Events still queued when a worker dies without a graceful shutdown are
+lost; close() flushes everything on shutdown.
+"""
+import os
+import asyncio
+import uuid
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+DOWNLOAD_BATCH_SIZE = int(os.getenv("DOWNLOAD_BATCH_SIZE", "100"))
+# Seconds between time-based flushes
+DOWNLOAD_FLUSH_INTERVAL = float(os.getenv("DOWNLOAD_FLUSH_INTERVAL", "2"))
+# Events kept while Mongo is failing before the oldest are dropped
+DOWNLOAD_BUFFER_MAX = int(os.getenv("DOWNLOAD_BUFFER_MAX", "50000"))
+
+
+class DownloadBuffer:
+    def __init__(self, db, on_flushed=None, batch_size=DOWNLOAD_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        # async on_flushed(user_ids) after each flush
+        self.on_flushed = on_flushed
+        self._pending = []
+        self._flushing = set()
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, user_id, resource_type, resource_id):
+        """Queue a download; never touches Mongo"""
+        self._pending.append({
+            "_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "resource_type": resource_type,  # 'paper', 'note', or 'syllabus'
+            "resource_id": resource_id,
+            "downloaded_at": datetime.utcnow()
+        })
+        if len(self._pending) >= self.batch_size and not self._flushing:
+            task = asyncio.create_task(self.flush())
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+
+    async def flush(self):
+        """Write every queued event; returns how many were written"""
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                await self.db.downloads.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Duplicate _ids mean a retried batch was partly written already
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    self._requeue(batch, e)
+                    return 0
+            except asyncio.CancelledError:
+                self._pending = batch + self._pending
+                raise
+            except Exception as e:
+                self._requeue(batch, e)
+                return 0
+
+            deltas = {}
+            for event in batch:
+                deltas[event["user_id"]] = deltas.get(event["user_id"], 0) + 1
+            await self.db.user_stats.bulk_write([
+                UpdateOne({"_id": user_id}, {"$inc": {"downloads": count}}, upsert=True)
+                for user_id, count in deltas.items()
+            ], ordered=False)
+            if self.on_flushed:
+                await self.on_flushed(list(deltas))
+            return len(batch)
+
+    def _requeue(self, batch, error):
+        """Put a failed batch back ahead of newer events for the next flush"""
+        self._pending = (batch + self._pending)[-DOWNLOAD_BUFFER_MAX:]
+        print(f"⚠️  Download flush failed, {len(self._pending)} events queued: {error}")
+
+    async def close(self):
+        """Wait for in-flight flushes, then write whatever is left"""
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+        while self._pending:
+            if not await self.flush():
+                break
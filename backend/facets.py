@@ -0,0 +1,115 @@
+"""
+In-memory facet counts (branch, year, tags) per resource type.
+Unfiltered and single-filter counts are running counters (the latter as
+co-occurrence counts per facet value), updated on every add/remove.
+Multi-filter counts intersect the per-value id sets, so they only touch
+the docs matching the rarest filter, never the whole collection.
+"""
+from collections import Counter
+
+FACET_FIELDS = ("branch", "year", "tags")
+
+
+def facet_values(row, field):
+    value = row.get(field)
+    if value is None or value == "":
+        return []
+    return list(dict.fromkeys(value)) if isinstance(value, list) else [value]
+
+
+class FacetCounts:
+    def __init__(self):
+        self._docs = {}         # (doc_type, id) -> {field: [values]}
+        self._counts = {}       # doc_type -> {field: Counter}
+        self._ids = {}          # (doc_type, field, value) -> set of ids
+        self._cooccur = {}      # (doc_type, field, value) -> {field: Counter} over docs with that value
+        self._totals = Counter()
+
+    def add(self, doc_type, row):
+        """Count a resource row (re-adding replaces the old values)"""
+        key = (doc_type, row["id"])
+        if key in self._docs:
+            self.remove(doc_type, row["id"])
+
+        values = {field: facet_values(row, field) for field in FACET_FIELDS}
+        self._docs[key] = values
+        self._totals[doc_type] += 1
+        counts = self._counts.setdefault(doc_type, {field: Counter() for field in FACET_FIELDS})
+        for field, field_values in values.items():
+            for value in field_values:
+                counts[field][value] += 1
+                self._ids.setdefault((doc_type, field, value), set()).add(row["id"])
+                cooccur = self._cooccur.setdefault(
+                    (doc_type, field, value), {other: Counter() for other in FACET_FIELDS}
+                )
+                for other, other_values in values.items():
+                    cooccur[other].update(other_values)
+
+    def add_many(self, items):
+        for doc_type, row in items:
+            self.add(doc_type, row)
+
+    def remove(self, doc_type, doc_id):
+        values = self._docs.pop((doc_type, doc_id), None)
+        if values is None:
+            return
+        self._totals[doc_type] -= 1
+        counts = self._counts[doc_type]
+        for field, field_values in values.items():
+            for value in field_values:
+                counts[field][value] -= 1
+                if counts[field][value] <= 0:
+                    del counts[field][value]
+                ids = self._ids[(doc_type, field, value)]
+                ids.discard(doc_id)
+                if not ids:
+                    del self._ids[(doc_type, field, value)]
+                    del self._cooccur[(doc_type, field, value)]
+                    continue
+                cooccur = self._cooccur[(doc_type, field, value)]
+                for other, other_values in values.items():
+                    cooccur[other].subtract(other_values)
+                    for other_value in other_values:
+                        if cooccur[other][other_value] <= 0:
+                            del cooccur[other][other_value]
+
+    def counts(self, doc_type, filters=None):
+        """{"total": n, field: {value: count}} for docs matching every (field, value) filter"""
+        filters = [(field, value) for field, value in (filters or []) if value not in (None, "")]
+        if not filters:
+            counts = self._counts.get(doc_type, {})
+            return self._response(self._totals[doc_type], {
+                field: counts.get(field, Counter()) for field in FACET_FIELDS
+            })
+        if len(filters) == 1:
+            field, value = filters[0]
+            key = (doc_type, field, value)
+            cooccur = self._cooccur.get(key, {})
+            return self._response(len(self._ids.get(key, ())), {
+                other: cooccur.get(other, Counter()) for other in FACET_FIELDS
+            })
+
+        # Intersect smallest set first so the work is bounded by the rarest filter
+        sets = sorted(
+            (self._ids.get((doc_type, field, value), set()) for field, value in filters),
+            key=len
+        )
+        matching = set(sets[0])
+        for ids in sets[1:]:
+            matching &= ids
+            if not matching:
+                break
+
+        counts = {field: Counter() for field in FACET_FIELDS}
+        for doc_id in matching:
+            for field, field_values in self._docs[(doc_type, doc_id)].items():
+                counts[field].update(field_values)
+        return self._response(len(matching), counts)
+
+    @staticmethod
+    def _response(total, counts):
+        result = {"total": total}
+        for field, counter in counts.items():
+            # Most common first, ties alphabetically
+            result[field] = dict(sorted(counter.items(), key=lambda item: (-item[1], str(item[0]))))
+        return result
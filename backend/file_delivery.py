@@ -0,0 +1,257 @@
+"""
+File responses with validators and byte ranges for the PDF view/download
+routes. Starlette's FileResponse always sends the whole file; here:
+
+- a strong ETag (the blob's sha256, or inode+mtime+size for other files)
+  and Last-Modified on every response
+- If-None-Match / If-Modified-Since answered with 304 and no body
+- Range: bytes=... answered with 206 - one part, or multipart/byteranges
+  for several - so PDF.js can fetch just the pages it shows; If-Range
+  falls back to the whole file when the client's copy is stale
+
+With FILE_DELIVERY set, the routes still do auth, lookup and download
+tracking but hand the bytes to the front proxy with an internal redirect
+(nginx X-Accel-Redirect, or X-Sendfile for Apache/lighttpd), which then
+answers validators and ranges itself. Only requests where the proxy sets
+X-Sendfile-Type to that header name are offloaded - anything reaching the
+worker directly is still streamed from here. For nginx:
+
+    location /api/ {
+        proxy_pass http://127.0.0.1:8001;
+        proxy_set_header X-Sendfile-Type X-Accel-Redirect;
+    }
+    location /protected-uploads/ {
+        internal;
+        alias /app/backend/uploads/;    # UPLOAD_DIR
+    }
+"""
+import os
+import uuid
+import anyio
+import aiofiles.os
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from starlette.responses import Response
+
+CHUNK_SIZE = 64 * 1024
+# More ranges than this in one request is treated as no Range at all
+MAX_RANGES = int(os.getenv("MAX_RANGES", "32"))
+# "app" streams from this process; "x-accel-redirect" or "x-sendfile" offloads to the proxy
+FILE_DELIVERY = os.getenv("FILE_DELIVERY", "app").lower()
+# The internal nginx location that maps to UPLOAD_DIR
+X_ACCEL_PREFIX = os.getenv("X_ACCEL_PREFIX", "/protected-uploads/")
+OFFLOAD_ROOT = os.path.abspath(os.getenv("UPLOAD_DIR", "uploads"))
+
+
+def parse_range(header, size):
+    """[(start, end inclusive)] for a `bytes=` Range header, sorted with overlaps
+    merged. None means ignore the header (serve 200), [] means unsatisfiable (416)."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    try:
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            first, dash, last = part.partition("-")
+            if not dash:
+                return None
+            if not first.strip():
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length > 0 and size > 0:
+                    ranges.append((max(0, size - length), size - 1))
+                continue
+            start = int(first)
+            end = int(last) if last.strip() else None
+            if start < 0 or (end is not None and end < start):
+                return None
+            if start < size:
+                ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+    except ValueError:
+        return None
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def make_etag(stat_result, content_hash=None):
+    if content_hash:
+        return f'"{content_hash}"'
+    return f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def etag_matches(header, etag, weak=True):
+    """Whether an If-None-Match / If-Range value lists `etag`"""
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified_since(header, mtime):
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+class RangeFileResponse(Response):
+    """Streams the whole file (200) or the given byte ranges (206)"""
+
+    def __init__(self, path, size, ranges, status_code, headers, media_type):
+        self.path = path
+        self.ranges = ranges
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.sends_start = not ranges or ranges[0][0] == 0
+        self.parts = []
+        if len(ranges) > 1:
+            boundary = uuid.uuid4().hex
+            for start, end in ranges:
+                part_header = (
+                    f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode()
+                self.parts.append((part_header, start, end))
+            self.closing = f"\r\n--{boundary}--\r\n".encode()
+            length = sum(len(header) + end - start + 1 for header, start, end in self.parts)
+            # Parts after the first are preceded by CRLF
+            length += 2 * (len(self.parts) - 1) + len(self.closing)
+            self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        else:
+            start, end = ranges[0] if ranges else (0, size - 1)
+            self.parts.append((b"", start, end))
+            self.closing = b""
+            length = end - start + 1
+            if status_code == 206:
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(max(length, 0))
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for i, (part_header, start, end) in enumerate(self.parts):
+                prefix = (b"\r\n" if i else b"") + part_header
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                await file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await file.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break  # file shrank under us
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": self.closing, "more_body": False})
+
+
+class OffloadResponse(Response):
+    """Empty response telling the front proxy which file to send"""
+
+    def __init__(self, headers, media_type, sends_start):
+        super().__init__(status_code=200, headers=headers, media_type=media_type)
+        self.sends_start = sends_start
+
+
+def offload_header(request, path):
+    """(header, value) redirecting this request's file to the proxy, or None to stream it here"""
+    if FILE_DELIVERY == "app" or request.headers.get("x-sendfile-type", "").lower() != FILE_DELIVERY:
+        return None
+    path = os.path.abspath(path)
+    if FILE_DELIVERY == "x-accel-redirect":
+        relative = os.path.relpath(path, OFFLOAD_ROOT)
+        if relative.startswith(os.pardir):
+            return None  # outside the location nginx serves
+        return "x-accel-redirect", X_ACCEL_PREFIX.rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))
+    if FILE_DELIVERY == "x-sendfile":
+        try:
+            path.encode("latin-1")
+        except UnicodeEncodeError:
+            return None
+        return "x-sendfile", path
+    return None
+
+
+async def file_response(request, path, media_type, content_hash=None, filename=None,
+                        disposition="attachment", cache_control="no-cache"):
+    """Response for `path` honouring the request's validators and Range header.
+    Raises FileNotFoundError if the file is gone."""
+    stat_result = await aiofiles.os.stat(path)
+    size = stat_result.st_size
+    etag = make_etag(stat_result, content_hash)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+    }
+    if filename is not None:
+        quoted = quote(filename)
+        if quoted != filename:
+            headers["content-disposition"] = f"{disposition}; filename*=utf-8''{quoted}"
+        else:
+            headers["content-disposition"] = f'{disposition}; filename="{filename}"'
+    else:
+        headers["content-disposition"] = disposition
+
+    offload = offload_header(request, path)
+    if offload:
+        # The proxy sets its own validators and handles ranges from the file; a
+        # request carrying validators is a revalidation of a copy the client has
+        for name in ("etag", "last-modified", "accept-ranges"):
+            del headers[name]
+        headers[offload[0]] = offload[1]
+        ranges = parse_range(request.headers.get("range", ""), size)
+        sends_start = not (
+            request.headers.get("if-none-match") or request.headers.get("if-modified-since")
+        ) and (not ranges or ranges[0][0] == 0)
+        return OffloadResponse(headers, media_type, sends_start)
+
+    # If-None-Match wins over If-Modified-Since when both are sent
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since and not_modified_since(if_modified_since, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    range_header = request.headers.get("range")
+    if range_header:
+        if_range = request.headers.get("if-range")
+        if if_range is None or (
+            etag_matches(if_range, etag, weak=False) if if_range.strip().startswith(('"', "W/"))
+            else if_range.strip() == headers["last-modified"]
+        ):
+            ranges = parse_range(range_header, size)
+    if ranges == []:
+        return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+    if ranges:
+        return RangeFileResponse(path, size, ranges, 206, headers, media_type)
+    return RangeFileResponse(path, size, [], 200, headers, media_type)
+
+
+def starts_file(response):
+    """Whether the response sends the start of the file - a new view or download
+    rather than a revalidation or a later page fetched by range"""
+    return getattr(response, "sends_start", False)
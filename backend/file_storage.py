@@ -0,0 +1,102 @@
+"""
+Streaming upload writer. Uploads are copied to disk UPLOAD_CHUNK_SIZE bytes
+at a time through a temp file that is renamed into place only once the
+whole file is written, so peak memory per upload is one chunk and readers
+never see a half-written PDF. SHA-256 and size are computed on the way
+through; crossing the size limit aborts the copy with UploadTooLarge.
+"""
+import os
+import uuid
+import hashlib
+import aiofiles
+import aiofiles.os
+from fastapi.responses import JSONResponse
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "100"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+# Room for the multipart boundaries and form fields around the file
+MULTIPART_OVERHEAD = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+async def stream_to_file(upload_file, file_path, max_bytes=MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Copy `upload_file` to `file_path` chunk by chunk; returns (sha256 hex, size)"""
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            while chunk := await upload_file.read(chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                await f.write(chunk)
+        await aiofiles.os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return digest.hexdigest(), size
+
+
+class BodyTooLarge(Exception):
+    """Raised from receive() once a request body crosses UploadSizeLimit's limit"""
+
+
+class UploadSizeLimit:
+    """ASGI middleware - answers 413 as soon as a request body is over the limit,
+    before the multipart parser spools it: straight away from Content-Length,
+    or once that many bytes of a chunked body have arrived"""
+
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def too_large(self):
+        return JSONResponse(
+            {"detail": f"File is larger than the {MAX_UPLOAD_MB} MB upload limit"},
+            status_code=413
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                return await self.too_large()(scope, receive, send)
+
+        state = {"received": 0, "exceeded": False, "started": False}
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > self.max_bytes:
+                    state["exceeded"] = True
+                    raise BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # Whatever the app answers after the cut-off (FastAPI turns a failed
+            # form parse into a 400) is replaced by the 413 below
+            if state["exceeded"] and not state["started"]:
+                return
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except BodyTooLarge:
+            pass
+        if state["exceeded"] and not state["started"]:
+            await self.too_large()(scope, receive, send)
@@ -0,0 +1,60 @@
+"""
+HyperLogLog cardinality sketch - estimates distinct viewers per forum post
+in a fixed 4 KB (2^12 one-byte registers, ~1.6% standard error). Sketches
+merge by taking the register-wise max, so per-worker sketches can be
+folded into the stored one in any order.
+"""
+import hashlib
+import math
+import numpy as np
+
+P = 12
+M = 1 << P
+REST_BITS = 64 - P
+REST_MASK = (1 << REST_BITS) - 1
+ALPHA = 0.7213 / (1 + 1.079 / M)
+
+
+def hash_key(key):
+    """64-bit hash of a viewer key"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    __slots__ = ("registers",)
+
+    def __init__(self, data=None):
+        if data is None:
+            self.registers = np.zeros(M, dtype=np.uint8)
+        else:
+            self.registers = np.frombuffer(bytes(data), dtype=np.uint8).copy()
+
+    def add(self, key):
+        h = hash_key(key)
+        index = h >> REST_BITS
+        rank = REST_BITS - (h & REST_MASK).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add_hashes(self, hashes):
+        """Vectorized add of precomputed hash_key() values (uint64 array)"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        index = (hashes >> np.uint64(REST_BITS)).astype(np.intp)
+        rest = (hashes & np.uint64(REST_MASK)).astype(np.float64)  # exact, REST_BITS <= 53
+        rank = (REST_BITS + 1 - np.frexp(rest)[1]).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        estimate = ALPHA * M * M / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * M and zeros:
+            # Small range: linear counting is more accurate
+            estimate = M * math.log(M / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return self.registers.tobytes()
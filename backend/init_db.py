@@ -42,6 +42,8 @@ def init_database():
                     {"_id": admin["_id"]},
                     {"$set": {"is_admin": True}}
                 )
+                # Running API workers drop their cached copy of this user
+                db.user_cache_invalidations.insert_one({"user_id": admin["_id"], "at": datetime.utcnow()})
                 print("✓ Updated admin privileges")
             return True
         
@@ -63,14 +65,8 @@ def init_database():
         print(f"  Email: {ADMIN_EMAIL}")
         print(f"  Password: {ADMIN_PASSWORD}")
         
-        # Create indexes for better performance
-        users_collection.create_index("email", unique=True)
-        db.papers.create_index([("created_at", -1)])
-        db.notes.create_index([("created_at", -1)])
-        db.syllabus.create_index([("created_at", -1)])
-        db.forum_posts.create_index([("last_activity", -1)])
+        # Indexes are managed by migrations.py when the server starts
         
-        print("✓ Database indexes created")
         return True
         
     except Exception as e:
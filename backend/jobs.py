@@ -0,0 +1,187 @@
+"""
+Background maintenance jobs - reconcile denormalized data with its source
+collections. Each job takes the Motor database so it can run from app
+startup, a periodic task or an admin endpoint.
+"""
+from datetime import datetime
+from pymongo import UpdateOne
+from achievements import achievement_doc, earned, insert_awards, EARLY_ADOPTER_COUNT
+
+BULK_BATCH_SIZE = 1000
+
+
+async def bulk_update(collection, ops):
+    """Unordered bulk_write in fixed-size batches; returns docs modified or upserted"""
+    modified = 0
+    for start in range(0, len(ops), BULK_BATCH_SIZE):
+        result = await collection.bulk_write(ops[start:start + BULK_BATCH_SIZE], ordered=False)
+        modified += result.modified_count + result.upserted_count
+    return modified
+
+
+def author_snapshot(user):
+    """The author fields copied onto forum posts and replies"""
+    if not user:
+        return None
+    return {"name": user["name"], "profile_photo": user.get("profile_photo")}
+
+
+async def reconcile_forum(db):
+    """Repair forum replies_count and author snapshots that drifted from the source data"""
+    reply_counts = {}
+    async for row in db.forum_replies.aggregate([
+        {"$group": {"_id": "$post_id", "count": {"$sum": 1}}}
+    ]):
+        reply_counts[row["_id"]] = row["count"]
+
+    authors = {}
+    async for user in db.users.find({}, {"name": 1, "profile_photo": 1}):
+        authors[user["_id"]] = author_snapshot(user)
+
+    post_ops = []
+    async for post in db.forum_posts.find({}, {"author_id": 1, "author": 1, "replies_count": 1}):
+        expected_count = reply_counts.get(post["_id"], 0)
+        if post.get("replies_count") != expected_count:
+            # Only overwrite if no reply landed since we read the count
+            post_ops.append(UpdateOne(
+                {"_id": post["_id"], "replies_count": post.get("replies_count")},
+                {"$set": {"replies_count": expected_count}}
+            ))
+        expected_author = authors.get(post["author_id"])
+        if post.get("author") != expected_author:
+            post_ops.append(UpdateOne({"_id": post["_id"]}, {"$set": {"author": expected_author}}))
+
+    reply_ops = []
+    async for reply in db.forum_replies.find({}, {"author_id": 1, "author": 1}):
+        expected_author = authors.get(reply["author_id"])
+        if reply.get("author") != expected_author:
+            reply_ops.append(UpdateOne({"_id": reply["_id"]}, {"$set": {"author": expected_author}}))
+
+    result = {
+        "posts_fixed": await bulk_update(db.forum_posts, post_ops),
+        "replies_fixed": await bulk_update(db.forum_replies, reply_ops),
+    }
+    if result["posts_fixed"] or result["replies_fixed"]:
+        print(f"✓ Forum reconcile: {result}")
+    return result
+
+
+# user_stats field -> [(source collection, extra filter, user id field)] it counts
+USER_STAT_SOURCES = {
+    "downloads": [("downloads", {}, "user_id")],
+    "bookmarks": [("bookmarks", {}, "user_id")],
+    "goals": [("learning_goals", {}, "user_id")],
+    "completed_goals": [("learning_goals", {"completed": True}, "user_id")],
+    "achievements": [("achievements", {}, "user_id")],
+    "uploads": [
+        ("papers", {}, "uploaded_by"),
+        ("notes", {}, "uploaded_by"),
+        ("syllabus", {}, "uploaded_by"),
+    ],
+    "forum_posts": [("forum_posts", {}, "author_id")],
+    # 1 if the user has a photo
+    "profile_photo": [("users", {"profile_photo": {"$nin": [None, ""]}}, "_id")],
+}
+
+
+async def count_user_sources(db):
+    """Grouped counts of every USER_STAT_SOURCES source as {user_id: {field: count}} -
+    one aggregation per source, not one query per user"""
+    counts = {}
+    for field, sources in USER_STAT_SOURCES.items():
+        for collection_name, match, user_field in sources:
+            async for row in db[collection_name].aggregate([
+                {"$match": match},
+                {"$group": {"_id": f"${user_field}", "count": {"$sum": 1}}}
+            ], allowDiskUse=True):
+                counts.setdefault(row["_id"], dict.fromkeys(USER_STAT_SOURCES, 0))[field] += row["count"]
+    return counts
+
+
+async def reconcile_user_stats(db):
+    """Rebuild per-user counters in user_stats from grouped counts of the source collections.
+    Counters are read before counting and each fix only applies if they haven't
+    moved since - a user active during the pass is left for the next one."""
+    current = {}
+    async for stats in db.user_stats.find({}):
+        current[stats["_id"]] = stats
+    expected = await count_user_sources(db)
+
+    ops = []
+    for user_id, stats in current.items():
+        counts = expected.pop(user_id, dict.fromkeys(USER_STAT_SOURCES, 0))
+        if any(stats.get(field) != value for field, value in counts.items()):
+            ops.append(UpdateOne(
+                {"_id": user_id, **{field: stats.get(field) for field in counts}},
+                {"$set": counts}
+            ))
+    # Users with activity but no counters doc yet - unless a $inc created one meanwhile
+    for user_id, counts in expected.items():
+        ops.append(UpdateOne({"_id": user_id}, {"$setOnInsert": counts}, upsert=True))
+
+    fixed = await bulk_update(db.user_stats, ops)
+    if fixed:
+        print(f"✓ User stats reconcile: {fixed} users fixed")
+    return {"users_fixed": fixed}
+
+
+# counters doc _id -> source collection it counts
+SITE_COUNTERS = {
+    "total_papers": "papers",
+    "total_notes": "notes",
+    "total_syllabus": "syllabus",
+    "total_users": "users",
+}
+
+
+async def reconcile_site_counters(db):
+    """Reset the /api/stats counters to the real collection sizes. A counter that
+    moved while its collection was counted is left for the next pass."""
+    current = {}
+    async for counter in db.counters.find({"_id": {"$in": list(SITE_COUNTERS)}}):
+        current[counter["_id"]] = counter.get("value")
+    counts = {}
+    for metric, collection_name in SITE_COUNTERS.items():
+        counts[metric] = await db[collection_name].count_documents({})
+
+    ops = []
+    for metric, value in counts.items():
+        if metric not in current:
+            ops.append(UpdateOne({"_id": metric}, {"$setOnInsert": {"value": value}}, upsert=True))
+        elif current[metric] != value:
+            ops.append(UpdateOne({"_id": metric, "value": current[metric]}, {"$set": {"value": value}}))
+    fixed = await bulk_update(db.counters, ops)
+    if fixed:
+        print(f"✓ Site counters reconcile: {fixed} counters fixed")
+    return counts
+
+
+async def recompute_achievements(db):
+    """Award every achievement a user qualifies for but doesn't hold, computed from
+    grouped counts of the source collections (catches thresholds crossed before a
+    rule existed or while awarding failed)"""
+    counts = await count_user_sources(db)
+
+    users = []
+    async for user in db.users.find({}, {"_id": 1}).sort([("created_at", 1), ("_id", 1)]):
+        users.append(user["_id"])
+    early_adopters = set(users[:EARLY_ADOPTER_COUNT])
+
+    held = {}
+    async for row in db.achievements.find({}, {"user_id": 1, "achievement_type": 1}):
+        held.setdefault(row["user_id"], set()).add(row["achievement_type"])
+
+    now = datetime.utcnow()
+    docs = []
+    for user_id in users:
+        qualifies = earned(counts.get(user_id, {}))
+        if user_id in early_adopters:
+            qualifies.append("early_adopter")
+        have = held.get(user_id, set())
+        docs += [achievement_doc(user_id, achievement_type, now) for achievement_type in qualifies if achievement_type not in have]
+
+    inserted = await insert_awards(db, docs)
+    result = {"users": len(users), "awarded": len(inserted)}
+    if inserted:
+        print(f"✓ Achievement recompute: {result}")
+    return result
@@ -6,6 +6,7 @@ Usage: python make_admin.py <email>
 import sys
 from pymongo import MongoClient
 import os
+from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -31,6 +32,8 @@ def make_admin(email):
             {"email": email},
             {"$set": {"is_admin": True}}
         )
+        # Running API workers drop their cached copy of this user
+        db.user_cache_invalidations.insert_one({"user_id": user["_id"], "at": datetime.utcnow()})
         
         print(f"✅ User '{user['name']}' ({email}) is now an admin!")
         return True
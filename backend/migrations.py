@@ -0,0 +1,384 @@
+"""
+Versioned index migrations - run on every app startup.
+Each migration declares the indexes it adds (plus an optional data step);
+the applied version is kept in the schema_migrations collection so
+re-running is a no-op. Workers starting together take turns through a
+lease doc in the same collection, so each data step runs once.
+"""
+import os
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure, DuplicateKeyError
+from jobs import reconcile_forum, reconcile_user_stats, reconcile_site_counters, recompute_achievements
+from blob_store import move_files_to_blobs
+from text_extraction import retry_pool_failures, backfill_body_terms
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+MIGRATION_LOCK_ID = "lock"
+# Renewed before each migration; a worker that dies holding it blocks the others this long
+MIGRATION_LEASE = timedelta(seconds=int(os.getenv("MIGRATION_LEASE_SECONDS", "600")))
+
+
+class MigrationFailed(Exception):
+    """A migration's data step or indexes failed - later migrations wait for it"""
+
+
+async def dedupe(collection, fields, created_field):
+    """Drop duplicate docs on `fields` so a unique index can build - keeps the
+    oldest by `created_field` (ids are random uuids, so _id only breaks ties)"""
+    pipeline = [
+        {"$sort": {created_field: 1, "_id": 1}},
+        {"$group": {
+            "_id": {field: f"${field}" for field in fields},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    removed = 0
+    async for group in collection.aggregate(pipeline, allowDiskUse=True):
+        result = await collection.delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += result.deleted_count
+    if removed:
+        print(f"⚠️  Removed {removed} duplicate docs from {collection.name}")
+
+
+async def duplicate_emails(db):
+    """Emails held by more than one user (left by the old check-then-insert register)"""
+    duplicates = {}
+    async for group in db.users.aggregate([
+        {"$group": {"_id": "$email", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True):
+        duplicates[group["_id"]] = group["ids"]
+    return duplicates
+
+
+async def dedupe_for_unique_indexes(db):
+    # Two accounts on one email can't be merged automatically - each may own
+    # uploads, bookmarks and posts - so stop here and say which ones
+    duplicates = await duplicate_emails(db)
+    if duplicates:
+        for email, user_ids in duplicates.items():
+            print(f"⚠️  Duplicate users for {email}: {', '.join(user_ids)}")
+        raise MigrationFailed(
+            f"{len(duplicates)} emails belong to more than one user - merge or delete the "
+            "extra accounts so the unique users.email index can build"
+        )
+    await dedupe(db.bookmarks, ["user_id", "resource_type", "resource_id"], "created_at")
+    await dedupe(db.achievements, ["user_id", "achievement_type"], "earned_at")
+
+
+# Ordered list of migrations. Never edit an applied entry - append a new one.
+MIGRATIONS = [
+    {
+        "version": 1,
+        "description": "Baseline indexes for every route query shape",
+        "run": dedupe_for_unique_indexes,
+        "indexes": {
+            "users": [
+                IndexModel([("email", ASCENDING)], unique=True),
+            ],
+            "papers": [
+                IndexModel([("created_at", DESCENDING)]),
+            ],
+            "notes": [
+                IndexModel([("created_at", DESCENDING)]),
+            ],
+            "syllabus": [
+                IndexModel([("created_at", DESCENDING)]),
+            ],
+            "bookmarks": [
+                IndexModel([("user_id", ASCENDING), ("resource_type", ASCENDING), ("resource_id", ASCENDING)], unique=True),
+                IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+            ],
+            "downloads": [
+                IndexModel([("user_id", ASCENDING), ("downloaded_at", DESCENDING)]),
+            ],
+            "achievements": [
+                IndexModel([("user_id", ASCENDING), ("achievement_type", ASCENDING)], unique=True),
+                IndexModel([("user_id", ASCENDING), ("earned_at", DESCENDING)]),
+            ],
+            "learning_goals": [
+                IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+                IndexModel([("user_id", ASCENDING), ("completed", ASCENDING)]),
+            ],
+            "forum_posts": [
+                IndexModel([("last_activity", DESCENDING)]),
+                IndexModel([("category", ASCENDING), ("last_activity", DESCENDING)]),
+                IndexModel([("author_id", ASCENDING)]),
+            ],
+            "forum_replies": [
+                IndexModel([("post_id", ASCENDING), ("created_at", ASCENDING)]),
+            ],
+        },
+    },
+    {
+        "version": 2,
+        "description": "Keyset pagination indexes on (created_at, _id) for resource lists",
+        "indexes": {
+            "papers": [
+                IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+                IndexModel([("branch", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+                IndexModel([("tags", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+            ],
+            "notes": [
+                IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+                IndexModel([("branch", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+                IndexModel([("tags", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+            ],
+            "syllabus": [
+                IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+                IndexModel([("branch", ASCENDING), ("year", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+                IndexModel([("year", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+                IndexModel([("tags", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+            ],
+        },
+    },
+    {
+        "version": 3,
+        "description": "Backfill denormalized replies_count and author snapshots on forum docs",
+        "run": reconcile_forum,
+        "indexes": {
+            "forum_replies": [
+                IndexModel([("author_id", ASCENDING)]),
+            ],
+        },
+    },
+    {
+        "version": 4,
+        "description": "Bookmark paging, category filter and resource cascade indexes",
+        "indexes": {
+            "bookmarks": [
+                IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+                IndexModel([("user_id", ASCENDING), ("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+                IndexModel([("resource_type", ASCENDING), ("resource_id", ASCENDING)]),
+            ],
+        },
+    },
+    {
+        "version": 5,
+        "description": "Backfill materialized per-user counters in user_stats",
+        "run": reconcile_user_stats,
+        "indexes": {},
+    },
+    {
+        "version": 6,
+        "description": "PDF text chunks and extraction progress indexes",
+        "indexes": {
+            "resource_chunks": [
+                IndexModel([("resource_type", ASCENDING), ("resource_id", ASCENDING), ("chunk", ASCENDING)]),
+            ],
+            "papers": [
+                IndexModel([("text_status", ASCENDING)]),
+            ],
+            "notes": [
+                IndexModel([("text_status", ASCENDING)]),
+            ],
+            "syllabus": [
+                IndexModel([("text_status", ASCENDING)]),
+            ],
+        },
+    },
+    {
+        "version": 7,
+        "description": "Backfill site-wide counters for /api/stats",
+        "run": reconcile_site_counters,
+        "indexes": {},
+    },
+    {
+        "version": 8,
+        "description": "Backfill upload, forum post and profile photo counters for achievement rules",
+        "run": reconcile_user_stats,
+        "indexes": {
+            "papers": [
+                IndexModel([("uploaded_by", ASCENDING)]),
+            ],
+            "notes": [
+                IndexModel([("uploaded_by", ASCENDING)]),
+            ],
+            "syllabus": [
+                IndexModel([("uploaded_by", ASCENDING)]),
+            ],
+        },
+    },
+    {
+        "version": 9,
+        "description": "Award achievements earned before the rule engine, including early adopters",
+        "run": recompute_achievements,
+        "indexes": {
+            "users": [
+                IndexModel([("created_at", ASCENDING)]),
+            ],
+        },
+    },
+    {
+        "version": 10,
+        "description": "Auth cache invalidation feed, expired after a day",
+        "indexes": {
+            "user_cache_invalidations": [
+                IndexModel([("at", ASCENDING)], expireAfterSeconds=86400),
+            ],
+        },
+    },
+    {
+        "version": 11,
+        "description": "Move uploaded PDFs into the content-addressed blob store",
+        "run": move_files_to_blobs,
+        "indexes": {},
+    },
+    {
+        "version": 12,
+        "description": "Retry PDFs whose text extraction failed because the worker pool crashed",
+        "run": retry_pool_failures,
+        "indexes": {},
+    },
+    {
+        "version": 13,
+        "description": "Per-PDF search terms so index rebuilds don't re-read every chunk",
+        "run": backfill_body_terms,
+        "indexes": {
+            "resource_terms": [
+                IndexModel([("updated_at", ASCENDING)]),
+            ],
+        },
+    },
+    {
+        "version": 14,
+        "description": "Sign-up order index for the early_adopter skip/limit and recompute scan",
+        "indexes": {
+            "users": [
+                # Both sort keys, so (created_at, _id) order is read off the index
+                IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)]),
+            ],
+        },
+    },
+]
+
+
+def declared_indexes():
+    """All indexes the migrations expect, as {collection: {index_name: key_spec}}"""
+    declared = {}
+    for migration in MIGRATIONS:
+        for collection_name, models in migration["indexes"].items():
+            for model in models:
+                spec = model.document
+                declared.setdefault(collection_name, {})[spec["name"]] = list(spec["key"].items())
+    return declared
+
+
+async def current_version(db):
+    # Only the numeric ids are versions - the lease doc shares the collection
+    latest = await db[MIGRATIONS_COLLECTION].find_one(
+        {"_id": {"$type": "number"}}, sort=[("_id", DESCENDING)]
+    )
+    return latest["_id"] if latest else 0
+
+
+async def take_lease(db, owner):
+    """Take or renew the migration lease; False while another worker holds it"""
+    now = datetime.utcnow()
+    try:
+        await db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": MIGRATION_LOCK_ID, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + MIGRATION_LEASE}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The upsert tried to insert a second lock doc - someone else's lease is live
+        return False
+    return True
+
+
+async def apply_pending(db, owner):
+    for migration in MIGRATIONS:
+        # Re-read each time - the previous lease holder may have applied it
+        if migration["version"] <= await current_version(db):
+            continue
+        if not await take_lease(db, owner):
+            raise RuntimeError("Lost the migration lease to another worker")
+
+        print(f"⏳ Applying migration {migration['version']}: {migration['description']}")
+        try:
+            # Data step runs first so e.g. unique indexes build on clean data
+            if migration.get("run"):
+                await migration["run"](db)
+            for collection_name, models in migration["indexes"].items():
+                await db[collection_name].create_indexes(models)
+        except Exception as e:
+            blocked = [later["version"] for later in MIGRATIONS if later["version"] > migration["version"]]
+            raise MigrationFailed(
+                f"Migration {migration['version']} failed, so migrations {blocked} can't run "
+                f"until it succeeds: {e}"
+            ) from e
+
+        await db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": migration["version"]},
+            {"$setOnInsert": {
+                "description": migration["description"],
+                "applied_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+
+
+async def run_migrations(db):
+    """Apply pending migrations under the lease, then re-ensure every declared index exists"""
+    if await current_version(db) < MIGRATIONS[-1]["version"]:
+        owner = uuid.uuid4().hex
+        waiting = False
+        while not await take_lease(db, owner):
+            if not waiting:
+                print("⏳ Waiting for another worker to finish migrations")
+                waiting = True
+            await asyncio.sleep(1)
+        try:
+            await apply_pending(db, owner)
+        finally:
+            await db[MIGRATIONS_COLLECTION].delete_one({"_id": MIGRATION_LOCK_ID, "owner": owner})
+
+    # create_indexes is a no-op for existing indexes, so this only repairs
+    # indexes someone dropped by hand
+    for migration in MIGRATIONS:
+        for collection_name, models in migration["indexes"].items():
+            await db[collection_name].create_indexes(models)
+
+    version = await current_version(db)
+    print(f"✓ Database schema at version {version}")
+    return version
+
+
+async def index_report(db):
+    """Compare declared indexes with what exists, plus usage counters from $indexStats"""
+    report = {}
+
+    for collection_name, expected in declared_indexes().items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+
+        usage = {}
+        try:
+            async for stat in collection.aggregate([{"$indexStats": {}}]):
+                usage[stat["name"]] = stat["accesses"]["ops"]
+        except OperationFailure:
+            pass  # $indexStats needs clusterMonitor - report without usage
+
+        indexes = []
+        for name, info in existing.items():
+            indexes.append({
+                "name": name,
+                "key": info["key"],
+                "unique": info.get("unique", False),
+                "ops": usage.get(name)
+            })
+
+        report[collection_name] = {
+            "indexes": indexes,
+            "missing": [name for name in expected if name not in existing],
+            "undeclared": [name for name in existing if name != "_id_" and name not in expected],
+            "unused": [name for name in existing if name != "_id_" and usage.get(name) == 0],
+        }
+
+    return report
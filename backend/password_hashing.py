@@ -0,0 +1,153 @@
+"""
+bcrypt off the event loop. Hashes and verifies run on a small thread pool
+(bcrypt releases the GIL, so threads use every core without pickling
+overhead) and admission is capped: once HASH_QUEUE_LIMIT operations are
+running or waiting, new ones fail immediately with HasherBusy instead of
+queueing behind a login storm.
+
+The bcrypt cost is calibrated to BCRYPT_TARGET_MS on the hardware we run
+on. The result is stored in the settings collection so every worker (and
+every login) agrees on one cost; hashes with any other cost are rehashed
+on the user's next successful login.
+"""
+import os
+import math
+import time
+import asyncio
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from passlib.hash import bcrypt
+from pymongo import ReturnDocument
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+# Hashes running + waiting per worker process before callers are turned away
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", str(HASH_WORKERS * 8)))
+
+# Target time for one hash; the calibrated cost is clamped to [MIN, MAX].
+# MIN is passlib's default cost, so calibration can raise it but never lower it
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "12"))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", "16"))
+# Fixed cost - skips calibration entirely
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+# Seconds between re-reads of the stored cost (picks up a recalibration)
+BCRYPT_SETTINGS_REFRESH = float(os.getenv("BCRYPT_SETTINGS_REFRESH", "60"))
+SETTINGS_ID = "bcrypt"
+
+
+class HasherBusy(Exception):
+    """The hashing queue is full - retry later"""
+
+
+def time_hash(rounds, samples=3):
+    """Best-of-`samples` seconds for one bcrypt hash at `rounds`"""
+    handler = bcrypt.using(rounds=rounds)
+    best = float("inf")
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.hash("calibration")
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def calibrate_rounds(target_ms=BCRYPT_TARGET_MS, min_rounds=BCRYPT_MIN_ROUNDS, max_rounds=BCRYPT_MAX_ROUNDS):
+    """Cost whose hash time is closest to `target_ms` - each round doubles the work,
+    so one probe at min_rounds is enough to extrapolate"""
+    probe_ms = time_hash(min_rounds) * 1000
+    rounds = min_rounds + round(math.log2(target_ms / probe_ms))
+    return max(min_rounds, min(max_rounds, rounds))
+
+
+class PasswordHasher:
+    def __init__(self, context, workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT):
+        self.context = context
+        self.queue_limit = queue_limit
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Released when the hash finishes, not when the caller stops waiting -
+        # a cancelled request still occupies its thread until bcrypt returns
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self.completed = 0
+        self.rejected = 0
+
+    async def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, _):
+        self.completed += 1
+        self._slots.release()
+
+    async def hash(self, password):
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password, hashed):
+        return await self._run(self.context.verify, password, hashed)
+
+    async def verify_and_update(self, password, hashed):
+        """(matches, new hash or None) - a new hash is returned when `hashed`
+        doesn't use the current cost"""
+        return await self._run(self.context.verify_and_update, password, hashed)
+
+    @property
+    def rounds(self):
+        return self.context.to_dict().get("bcrypt__default_rounds")
+
+    def set_rounds(self, rounds):
+        # min == max == default, so needs_update flags hashes with any other cost.
+        # A new context swapped in with one assignment - update() would change the
+        # shared one while pool threads are hashing and verifying with it
+        self.context = self.context.copy(
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+
+    async def calibrate(self):
+        """Measure the cost for BCRYPT_TARGET_MS on this machine (runs on the pool)"""
+        return await asyncio.get_running_loop().run_in_executor(self._pool, calibrate_rounds)
+
+    async def load_rounds(self, db, recalibrate=False):
+        """Adopt the deployment-wide cost from the settings collection, calibrating
+        it here if nobody has yet (or if `recalibrate`)"""
+        if BCRYPT_ROUNDS:
+            self.set_rounds(int(BCRYPT_ROUNDS))
+            return self.rounds
+        settings = None if recalibrate else await db.settings.find_one({"_id": SETTINGS_ID})
+        if settings is None:
+            rounds = await self.calibrate()
+            fields = {"rounds": rounds, "target_ms": BCRYPT_TARGET_MS, "calibrated_at": datetime.utcnow()}
+            # $setOnInsert: workers calibrating at the same time all adopt the first result
+            settings = await db.settings.find_one_and_update(
+                {"_id": SETTINGS_ID},
+                {"$set": fields} if recalibrate else {"$setOnInsert": fields},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            print(f"✓ bcrypt cost calibrated: {settings['rounds']} rounds for ~{BCRYPT_TARGET_MS:.0f} ms")
+        # A cost stored by an older calibration never takes us below the floor
+        rounds = max(settings["rounds"], BCRYPT_MIN_ROUNDS)
+        if rounds != self.rounds:
+            self.set_rounds(rounds)
+        return self.rounds
+
+    def stats(self):
+        return {
+            "workers": self._pool._max_workers,
+            "queue_limit": self.queue_limit,
+            "rounds": self.rounds,
+            "in_flight": self.queue_limit - self._slots._value,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
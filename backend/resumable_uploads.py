@@ -0,0 +1,184 @@
+"""
+Resumable uploads for large PDFs. A client opens a session, PUTs the file
+in chunks at explicit offsets, can ask how much arrived after a dropped
+connection, and finally completes the session into a normal resource.
+
+Sessions live on disk under UPLOAD_DIR/sessions/<id>/ (meta.json plus the
+bytes received so far in data), so every worker on the host sees the same
+state. The size of the data file is the received offset. An flock on it
+keeps two requests from writing the same session at once. Sessions idle
+for UPLOAD_SESSION_TTL_HOURS are garbage collected.
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import asyncio
+import aiofiles
+import aiofiles.os
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+UPLOAD_SESSION_DIR = os.path.join(os.getenv("UPLOAD_DIR", "uploads"), "sessions")
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24")) * 3600
+UPLOAD_SESSION_GC_INTERVAL = int(os.getenv("UPLOAD_SESSION_GC_INTERVAL", "3600"))
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class SessionBusy(Exception):
+    """Another request is writing or completing this session"""
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class ChunkTooLarge(Exception):
+    """The chunk would take the upload past its declared size"""
+
+
+class UploadSession:
+    def __init__(self, session_id, meta, offset, last_active):
+        self.id = session_id
+        self.meta = meta
+        self.offset = offset
+        self.last_active = last_active
+
+    @property
+    def size(self):
+        return self.meta["size"]
+
+    @property
+    def data_path(self):
+        return os.path.join(UPLOAD_SESSION_DIR, self.id, "data")
+
+    @property
+    def expires_at(self):
+        return datetime.utcfromtimestamp(self.last_active + UPLOAD_SESSION_TTL)
+
+    def status(self):
+        return {"upload_id": self.id, "offset": self.offset, "size": self.size, "expires_at": self.expires_at}
+
+
+def session_dir(session_id):
+    # ids are uuid4 hex - anything else can't be ours (and can't escape the directory)
+    if len(session_id) != 32 or not all(c in "0123456789abcdef" for c in session_id):
+        raise SessionNotFound()
+    return os.path.join(UPLOAD_SESSION_DIR, session_id)
+
+
+async def create_session(owner, size, metadata):
+    session_id = uuid.uuid4().hex
+    path = os.path.join(UPLOAD_SESSION_DIR, session_id)
+    await aiofiles.os.makedirs(path)
+    meta = {"owner": owner, "size": size, "metadata": metadata, "created_at": time.time()}
+    async with aiofiles.open(os.path.join(path, "meta.json"), "w") as f:
+        await f.write(json.dumps(meta))
+    async with aiofiles.open(os.path.join(path, "data"), "wb"):
+        pass
+    return await load_session(session_id, owner)
+
+
+async def load_session(session_id, owner):
+    """The session if it exists and belongs to `owner`"""
+    path = session_dir(session_id)
+    try:
+        async with aiofiles.open(os.path.join(path, "meta.json")) as f:
+            meta = json.loads(await f.read())
+        stat = await aiofiles.os.stat(os.path.join(path, "data"))
+    except (OSError, ValueError):
+        raise SessionNotFound()
+    if meta["owner"] != owner:
+        raise SessionNotFound()
+    return UploadSession(session_id, meta, stat.st_size, max(stat.st_mtime, meta["created_at"]))
+
+
+@asynccontextmanager
+async def locked_session(session_id, owner):
+    """Hold the session's write lock (raises SessionBusy if someone else has it)"""
+    session = await load_session(session_id, owner)
+    async with aiofiles.open(session.data_path, "ab") as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise SessionBusy()
+        try:
+            # Re-read under the lock - the previous holder may have moved it on
+            session = await load_session(session_id, owner)
+            session.file = f
+            yield session
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+async def save_meta(session):
+    """Rewrite the session's meta.json (write a temp file, then rename over it)"""
+    path = os.path.join(session_dir(session.id), "meta.json")
+    staged = f"{path}.{uuid.uuid4().hex}.tmp"
+    async with aiofiles.open(staged, "w") as f:
+        await f.write(json.dumps(session.meta))
+    await aiofiles.os.replace(staged, path)
+
+
+async def append_chunk(session_id, owner, offset, chunks):
+    """Append the async iterable of bytes `chunks` at `offset`; returns the new offset.
+    Bytes that arrived before a dropped connection are kept - that's what
+    the client resumes from."""
+    async with locked_session(session_id, owner) as session:
+        if offset != session.offset:
+            raise OffsetMismatch(session.offset)
+        received = session.offset
+        try:
+            async for chunk in chunks:
+                if received + len(chunk) > session.size:
+                    raise ChunkTooLarge()
+                await session.file.write(chunk)
+                received += len(chunk)
+        finally:
+            await session.file.flush()
+        return received
+
+
+async def remove_session(session_id):
+    await asyncio.to_thread(shutil.rmtree, session_dir(session_id), True)
+
+
+def collect_expired_sessions():
+    """Delete sessions idle for longer than UPLOAD_SESSION_TTL; returns how many"""
+    if not os.path.isdir(UPLOAD_SESSION_DIR):
+        return 0
+    cutoff = time.time() - UPLOAD_SESSION_TTL
+    removed = 0
+    for session_id in os.listdir(UPLOAD_SESSION_DIR):
+        path = os.path.join(UPLOAD_SESSION_DIR, session_id)
+        try:
+            last_active = max(os.stat(os.path.join(path, name)).st_mtime for name in ("meta.json", "data"))
+        except (OSError, ValueError):
+            last_active = os.stat(path).st_mtime  # half-created session
+        if last_active >= cutoff:
+            continue
+        try:
+            with open(os.path.join(path, "data"), "ab") as f:
+                # Skip sessions a request is still writing
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                shutil.rmtree(path, ignore_errors=True)
+        except BlockingIOError:
+            continue
+        except OSError:
+            shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+async def collect_expired():
+    removed = await asyncio.to_thread(collect_expired_sessions)
+    if removed:
+        print(f"✓ Removed {removed} abandoned upload sessions")
+    return removed
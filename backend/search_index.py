@@ -0,0 +1,391 @@
+"""
+In-memory full-text search over papers, notes and syllabus.
+Inverted index with BM25 ranking over title, description, tags and branch.
+
+Each term's postings live in numpy arrays sorted by slot; a term in more
+than 1/DENSE_FRACTION of the docs also keeps its components in a dense
+per-slot array, built on first use, so looking it up is a single gather.
+A query is scored MaxScore-style: the exact scores of a few likely winners
+(each term's highest-impact postings) give a lower bound on the k-th best
+score.
+Terms whose upper bounds together stay under it can't put a doc in the top
+k on their own, so only the other terms' postings are scanned into a score
+buffer (kept zeroed between queries); the rest are looked up for the
+surviving candidates only. Partial scores never exceed final ones, so the
+bound is raised to their k-th best after each term, and candidates that
+can no longer reach it are dropped as it goes. argpartition then picks the top k.
+"""
+import os
+import re
+import math
+from collections import Counter
+import numpy as np
+
+# Field weights - a title hit counts for more than a description hit
+FIELD_WEIGHTS = {"title": 3.0, "tags": 2.0, "branch": 1.0, "description": 1.0}
+# Text extracted from the PDF itself - indexed but never returned
+BODY_WEIGHT = 0.5
+# Only a PDF's most frequent body terms are kept - enough to find it by subject
+BODY_TERM_LIMIT = int(os.getenv("BODY_TERM_LIMIT", "200"))
+K1 = 1.2
+B = 0.75
+# Re-weight every posting when the corpus size drifts this far from the
+# size the average doc length was computed at
+AVGDL_DRIFT = 0.1
+# Highest-impact postings per term scored up front to find the top-k bound
+THRESHOLD_CANDIDATES = 64
+# Terms in more than 1/DENSE_FRACTION of the docs get a dense component array
+# (4 bytes a slot, built the first time a query needs it)
+DENSE_FRACTION = 16
+# float32 sums can land a hair above the float64 bounds
+BOUND_SLACK = 1 + 1e-5
+
+DOC_TYPES = ["paper", "note", "syllabus"]
+STOPWORDS = {"a", "an", "and", "the", "of", "for", "to", "in", "on", "with", "by", "is", "at"}
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def body_terms(text, limit=BODY_TERM_LIMIT):
+    """{term: count} of the `limit` most frequent terms of extracted PDF text"""
+    return dict(Counter(tokenize(text)).most_common(limit))
+
+
+class _Postings:
+    """One term's postings as parallel slot / weighted tf / BM25 component arrays,
+    sorted by slot"""
+    __slots__ = ("slots", "tf", "comp", "_max", "_top", "_dense")
+
+    def __init__(self, slots, tf):
+        self.slots = np.asarray(slots, dtype=np.int64)
+        self.tf = np.asarray(tf, dtype=np.float32)
+        if len(self.slots) > 1 and not (np.diff(self.slots) > 0).all():
+            order = np.argsort(self.slots, kind="stable")
+            self.slots = self.slots[order]
+            self.tf = self.tf[order]
+        self.comp = np.zeros(len(self.slots), dtype=np.float32)
+        self._changed()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _changed(self):
+        self._max = None
+        self._top = None
+        self._dense = None
+
+    def reweight(self, doc_len, avgdl):
+        norm = (K1 * (1 - B + B * doc_len[self.slots] / avgdl)).astype(np.float32)
+        self.comp = self.tf * np.float32(K1 + 1) / (self.tf + norm)
+        self._changed()
+
+    def append(self, slot, tf, comp):
+        i = int(np.searchsorted(self.slots, slot))
+        self.slots = np.insert(self.slots, i, np.int64(slot))
+        self.tf = np.insert(self.tf, i, np.float32(tf))
+        self.comp = np.insert(self.comp, i, np.float32(comp))
+        self._changed()
+
+    def delete(self, slot):
+        i = int(np.searchsorted(self.slots, slot))
+        self.slots = np.delete(self.slots, i)
+        self.tf = np.delete(self.tf, i)
+        self.comp = np.delete(self.comp, i)
+        self._changed()
+
+    def max_comp(self):
+        if self._max is None:
+            self._max = float(self.comp.max())
+        return self._max
+
+    def top_slots(self):
+        """Slots of the THRESHOLD_CANDIDATES highest components"""
+        if self._top is None:
+            if len(self.comp) > THRESHOLD_CANDIDATES:
+                self._top = self.slots[np.argpartition(self.comp, -THRESHOLD_CANDIDATES)[-THRESHOLD_CANDIDATES:]]
+            else:
+                self._top = self.slots
+        return self._top
+
+    def dense(self, capacity):
+        """Components as a capacity-long array, 0 where the term doesn't occur"""
+        if self._dense is None or len(self._dense) != capacity:
+            self._dense = np.zeros(capacity, dtype=np.float32)
+            self._dense[self.slots] = self.comp
+        return self._dense
+
+    def lookup(self, slots):
+        """Components at sorted `slots`, 0 where the term doesn't occur"""
+        i = np.minimum(np.searchsorted(self.slots, slots), len(self.slots) - 1)
+        return np.where(self.slots[i] == slots, self.comp[i], np.float32(0))
+
+
+class SearchIndex:
+    def __init__(self, capacity=1024):
+        self._slots = {}        # key -> slot
+        self._rows = []         # slot -> row returned to the client (None if free)
+        self._terms = []        # slot -> {term: weighted tf}
+        self._bodies = []       # slot -> {term: count} from the PDF, or None
+        self._free = []         # reusable slots
+        self._doc_len = np.zeros(capacity)
+        self._scores = np.zeros(capacity, dtype=np.float32)  # all zero outside search()
+        self._type_code = np.full(capacity, -1, dtype=np.int8)
+        self._branch_code = np.full(capacity, -1, dtype=np.int32)
+        self._branches = {}     # branch name -> code
+        self._postings = {}     # term -> _Postings
+        self._total_len = 0.0
+        self._avgdl = 1.0
+        self._avgdl_n = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    @staticmethod
+    def key(doc_type, doc_id):
+        return f"{doc_type}:{doc_id}"
+
+    def _grow(self, needed):
+        capacity = len(self._doc_len)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        extra = capacity - len(self._doc_len)
+        self._doc_len = np.concatenate([self._doc_len, np.zeros(extra)])
+        self._scores = np.concatenate([self._scores, np.zeros(extra, dtype=np.float32)])
+        self._type_code = np.concatenate([self._type_code, np.full(extra, -1, dtype=np.int8)])
+        self._branch_code = np.concatenate([self._branch_code, np.full(extra, -1, dtype=np.int32)])
+
+    def _store(self, doc_type, row, body=None):
+        """Allocate a slot for `row` and record its per-doc data; returns (slot, terms)"""
+        terms = {}
+        doc_len = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            value = row.get(field) or ""
+            if isinstance(value, list):
+                value = " ".join(value)
+            for token in tokenize(value):
+                terms[token] = terms.get(token, 0.0) + weight
+                doc_len += weight
+        for token, count in (body or {}).items():
+            terms[token] = terms.get(token, 0.0) + BODY_WEIGHT * count
+            doc_len += BODY_WEIGHT * count
+
+        if self._free:
+            slot = self._free.pop()
+            self._rows[slot] = {**row, "type": doc_type}
+            self._terms[slot] = terms
+            self._bodies[slot] = body
+        else:
+            slot = len(self._rows)
+            self._rows.append({**row, "type": doc_type})
+            self._terms.append(terms)
+            self._bodies.append(body)
+            self._grow(slot + 1)
+
+        self._slots[self.key(doc_type, row["id"])] = slot
+        self._doc_len[slot] = doc_len
+        self._type_code[slot] = DOC_TYPES.index(doc_type)
+        self._branch_code[slot] = self._branches.setdefault(row.get("branch"), len(self._branches))
+        self._total_len += doc_len
+        return slot, terms
+
+    def _reweight(self):
+        """Recompute every tf component against the current average doc length"""
+        self._avgdl = (self._total_len / len(self._slots)) if self._slots else 1.0
+        self._avgdl_n = len(self._slots)
+        for postings in self._postings.values():
+            postings.reweight(self._doc_len, self._avgdl)
+
+    def _maybe_reweight(self):
+        n = len(self._slots)
+        if abs(n - self._avgdl_n) > max(1, self._avgdl_n * AVGDL_DRIFT):
+            self._reweight()
+
+    def add(self, doc_type, row, body=None):
+        """Index (or re-index) a resource row; `row` must have id and the FIELD_WEIGHTS fields,
+        `body` is optional {term: count} from the PDF (see body_terms)"""
+        if self.key(doc_type, row["id"]) in self._slots:
+            self.remove(doc_type, row["id"])
+
+        slot, terms = self._store(doc_type, row, body)
+        doc_len = self._doc_len[slot]
+        for term, tf in terms.items():
+            comp = tf * (K1 + 1) / (tf + K1 * (1 - B + B * doc_len / self._avgdl))
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings([slot], [tf])
+                postings.reweight(self._doc_len, self._avgdl)
+            else:
+                postings.append(slot, tf, comp)
+        self._maybe_reweight()
+
+    def add_many(self, items):
+        """Bulk load (doc_type, row, body) triples - builds each term's arrays once"""
+        pending = {}
+        for doc_type, row, body in items:
+            if self.key(doc_type, row["id"]) in self._slots:
+                self.remove(doc_type, row["id"])
+            slot, terms = self._store(doc_type, row, body)
+            for term, tf in terms.items():
+                slots, tfs = pending.setdefault(term, ([], []))
+                slots.append(slot)
+                tfs.append(tf)
+
+        for term, (slots, tfs) in pending.items():
+            existing = self._postings.get(term)
+            if existing is not None:
+                slots = np.concatenate([existing.slots, slots])
+                tfs = np.concatenate([existing.tf, tfs])
+            self._postings[term] = _Postings(slots, tfs)
+        self._reweight()
+
+    def get(self, doc_type, doc_id):
+        """The indexed row for a resource, or None"""
+        slot = self._slots.get(self.key(doc_type, doc_id))
+        return None if slot is None else {k: v for k, v in self._rows[slot].items() if k != "type"}
+
+    def body(self, doc_type, doc_id):
+        """The PDF body terms a resource was indexed with, or None"""
+        slot = self._slots.get(self.key(doc_type, doc_id))
+        return None if slot is None else self._bodies[slot]
+
+    def remove(self, doc_type, doc_id):
+        slot = self._slots.pop(self.key(doc_type, doc_id), None)
+        if slot is None:
+            return
+        for term in self._terms[slot]:
+            postings = self._postings[term]
+            if len(postings) == 1:
+                del self._postings[term]
+            else:
+                postings.delete(slot)
+
+        self._total_len -= self._doc_len[slot]
+        self._rows[slot] = None
+        self._terms[slot] = None
+        self._bodies[slot] = None
+        self._type_code[slot] = -1
+        self._branch_code[slot] = -1
+        self._free.append(slot)
+        self._maybe_reweight()
+
+    def search(self, query, limit=20, doc_type=None, branch=None):
+        """Top `limit` rows for `query`, best first, each with a `score`"""
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self._postings]
+        if not terms or limit <= 0:
+            return []
+        if branch is not None and branch not in self._branches:
+            return []
+
+        n = len(self._slots)
+        weighted = []
+        for term in terms:
+            p = self._postings[term]
+            idf = math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            weighted.append((np.float32(idf), p, idf * p.max_comp()))
+        type_code = DOC_TYPES.index(doc_type) if doc_type else None
+        branch_code = self._branches[branch] if branch is not None else None
+        threshold = self._threshold(weighted, limit, type_code, branch_code)
+
+        # Lowest bounds first: docs matching only an "optional" prefix whose bounds
+        # sum below the threshold can't make the top k
+        weighted.sort(key=lambda w: w[2])
+        optional = 0
+        remaining = 0.0
+        while optional < len(weighted) and (remaining + weighted[optional][2]) * BOUND_SLACK < threshold:
+            remaining += weighted[optional][2]
+            optional += 1
+
+        slots, values = self._scan([(idf, p.slots, p.comp) for idf, p, _ in weighted[optional:]])
+        keep = self._passes(slots, type_code, branch_code)
+        if optional:
+            upper = values + np.float32(remaining * BOUND_SLACK)
+            keep = upper >= threshold if keep is None else keep & (upper >= threshold)
+        if keep is not None:
+            slots, values = slots[keep], values[keep]
+
+        for idf, p, bound in reversed(weighted[:optional]):
+            values = values + idf * self._lookup(p, slots)
+            remaining -= bound
+            # Scores so far never exceed the final ones, so their k-th best
+            # is a bound too - usually a much tighter one
+            if len(values) > limit:
+                threshold = max(threshold, float(np.partition(values, len(values) - limit)[len(values) - limit]))
+            keep = values + np.float32(max(remaining, 0.0) * BOUND_SLACK) >= threshold
+            # Compacting costs more than it saves when nearly everything survives
+            if np.count_nonzero(keep) < len(keep) * 0.9:
+                slots, values = slots[keep], values[keep]
+
+        if len(values) > limit:
+            # Everything tied with the k-th best, so ties break the same way every time
+            cutoff = values[np.argpartition(values, len(values) - limit)[len(values) - limit]]
+            top = values >= cutoff
+            slots, values = slots[top], values[top]
+        order = np.lexsort((slots, -values))[:limit]
+        return [
+            {**self._rows[slot], "score": round(float(score), 4)}
+            for slot, score in zip(slots[order].tolist(), values[order].tolist())
+        ]
+
+    def _passes(self, slots, type_code, branch_code):
+        """Mask of `slots` matching the type/branch filters, or None if unfiltered"""
+        keep = None
+        if type_code is not None:
+            keep = self._type_code[slots] == type_code
+        if branch_code is not None:
+            in_branch = self._branch_code[slots] == branch_code
+            keep = in_branch if keep is None else keep & in_branch
+        return keep
+
+    def _threshold(self, weighted, limit, type_code, branch_code):
+        """Exact k-th best score among every term's highest-impact postings - never
+        above the real k-th best. 0 (no pruning) if too few of them pass the filters."""
+        if len(weighted) < 2:
+            return 0.0
+        slots = np.unique(np.concatenate([p.top_slots() for _, p, _ in weighted]))
+        keep = self._passes(slots, type_code, branch_code)
+        if keep is not None:
+            slots = slots[keep]
+        if len(slots) < limit:
+            return 0.0
+        values = np.zeros(len(slots), dtype=np.float32)
+        for idf, p, _ in weighted:
+            values += idf * self._lookup(p, slots)
+        return float(np.partition(values, len(values) - limit)[len(values) - limit])
+
+    def _scan(self, parts):
+        """(slots, scores) over the union of (idf, slots, components) postings"""
+        if len(parts) == 1:
+            idf, slots, comp = parts[0]
+            return slots, idf * comp
+        scores = self._scores
+        matched = []
+        for idf, slots, comp in parts:
+            # Every contribution is positive, so a zero score means first seen
+            matched.append(slots[scores[slots] == 0] if matched else slots)
+            # Slots are unique within a posting list - plain fancy-index add is safe
+            scores[slots] += idf * comp
+        slots = np.concatenate(matched)
+        values = scores[slots]
+        scores[slots] = 0.0
+        return slots, values
+
+    def _lookup(self, p, slots):
+        """p's components at candidate `slots` - a gather for dense terms, binary
+        search for a few candidates, a pass over the postings for many"""
+        if len(p) * DENSE_FRACTION > len(self._slots):
+            return p.dense(len(self._doc_len))[slots]
+        if len(slots) * 32 < len(p):
+            order = np.argsort(slots)
+            comps = np.empty(len(slots), dtype=np.float32)
+            comps[order] = p.lookup(slots[order])
+            return comps
+        scores = self._scores
+        scores[p.slots] = p.comp
+        comps = scores[slots]
+        scores[p.slots] = 0.0
+        return comps
@@ -0,0 +1,78 @@
+"""
+Fast response path for list endpoints - rows go straight from Mongo
+(projected to the fields we return) into orjson, with no per-row
+Pydantic model and no second validation pass through response_model.
+"""
+import orjson
+from fastapi.responses import JSONResponse
+
+# Only fetch what the list responses actually return
+RESOURCE_PROJECTION = {
+    "title": 1,
+    "branch": 1,
+    "description": 1,
+    "tags": 1,
+    "file_path": 1,
+    "uploaded_by": 1,
+    "created_at": 1,
+}
+SYLLABUS_PROJECTION = {**RESOURCE_PROJECTION, "year": 1}
+FORUM_POST_PROJECTION = {
+    "title": 1,
+    "content": 1,
+    "category": 1,
+    "tags": 1,
+    "author_id": 1,
+    "author": 1,
+    "replies_count": 1,
+    "views": 1,
+    "unique_viewers": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "last_activity": 1,
+}
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson (handles datetimes natively)"""
+
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def resource_row(doc):
+    """Shape a paper/note/syllabus doc like PaperResponse / SyllabusResponse"""
+    row = {
+        "id": doc["_id"],
+        "title": doc["title"],
+        "branch": doc["branch"],
+        "description": doc.get("description", ""),
+        "tags": doc.get("tags", []),
+        "file_path": doc["file_path"],
+        "uploaded_by": doc["uploaded_by"],
+        "created_at": doc["created_at"],
+    }
+    if "year" in doc:
+        row["year"] = doc["year"]
+    return row
+
+
+def forum_post_row(post):
+    """Shape a forum post doc (with its denormalized author/replies_count) like ForumPost"""
+    author = post.get("author")
+    return {
+        "id": post["_id"],
+        "title": post["title"],
+        "content": post["content"],
+        "category": post["category"],
+        "tags": post.get("tags", []),
+        "author_id": post["author_id"],
+        "author_name": author["name"] if author else "Unknown User",
+        "replies_count": post.get("replies_count", 0),
+        "views": post.get("views", 0),
+        "unique_viewers": post.get("unique_viewers", 0),
+        "created_at": post["created_at"],
+        "updated_at": post.get("updated_at", post["created_at"]),
+        "last_activity": post.get("last_activity", post["created_at"]),
+        "author_profile_photo": author.get("profile_photo") if author else None,
+    }
@@ -1,25 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Query, BackgroundTasks, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional, List
 from pydantic import BaseModel, EmailStr
-from pymongo import MongoClient
 import os
+import time
+import asyncio
 import uuid
+import json
+import base64
 from pathlib import Path
-import aiofiles
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 from emergentintegrations.llm.chat import LlmChat, UserMessage
+from file_storage import stream_to_file, UploadTooLarge, UploadSizeLimit, MAX_UPLOAD_BYTES, MAX_UPLOAD_MB
 
 load_dotenv()
 
 # Main app instance
 app = FastAPI(title="Academic Resources API", version="1.0.0")
 
+# Oversized uploads are refused from Content-Length alone (added first so
+# CORS still wraps the 413)
+app.add_middleware(UploadSizeLimit)
+
 # CORS - allowing all origins for now (tighten this in production)
 app.add_middleware(
     CORSMiddleware,
@@ -27,88 +35,156 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Auth setup
 security = HTTPBearer()
+# For public routes that only want to know who the caller is, if anyone
+optional_security = HTTPBearer(auto_error=False)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Config from env
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
-MONGO_URL = os.getenv("MONGO_URL")
-DATABASE_NAME = os.getenv("DATABASE_NAME")
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_PROFILE_PHOTO_BYTES = int(os.getenv("MAX_PROFILE_PHOTO_MB", "5")) * 1024 * 1024
 EMERGENT_LLM_KEY = os.getenv("EMERGENT_LLM_KEY")
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+# Seconds between background counter reconciles (0 disables)
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "3600"))
+# Seconds a worker may serve /api/stats from memory (other workers' writes
+# show up within this window)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "5"))
+# Seconds between full search index rebuilds (0 disables). Each worker keeps
+# its own index, so this is how uploads made on other workers show up.
+SEARCH_REBUILD_INTERVAL = int(os.getenv("SEARCH_REBUILD_INTERVAL", "300"))
+# Rebuilds also pick up body terms stored this long before the previous build started
+SEARCH_BODY_SKEW = timedelta(seconds=60)
 
 # Make sure upload folders exist
 Path(UPLOAD_DIR).mkdir(exist_ok=True)
 for folder in ["papers", "notes", "syllabus", "profile_photos"]:
     Path(f"{UPLOAD_DIR}/{folder}").mkdir(exist_ok=True)
 
-# MongoDB connection
-try:
-    client = MongoClient(MONGO_URL)
-    db = client[DATABASE_NAME]
-    
-    # All collections we need
-    users_collection = db.users
-    papers_collection = db.papers
-    notes_collection = db.notes
-    syllabus_collection = db.syllabus
-    chat_messages_collection = db.chat_messages
-    bookmarks_collection = db.bookmarks
-    achievements_collection = db.achievements
-    learning_goals_collection = db.learning_goals
-    downloads_collection = db.downloads  # Track actual downloads
-    forum_posts_collection = db.forum_posts  # Forum posts
-    forum_replies_collection = db.forum_replies  # Forum replies
-    
-    # Quick ping to check if DB is alive
-    client.admin.command('ping')
-    print("✓ MongoDB connected successfully")
-    
-    # BULLETPROOF DATA PROTECTION: Auto-restore ONLY if completely empty
-    import subprocess
-    import os
-    
-    # Check if database has ANY data
-    total_records = (
-        users_collection.count_documents({}) +
-        papers_collection.count_documents({}) +
-        notes_collection.count_documents({}) +
-        syllabus_collection.count_documents({})
-    )
-    
-    # Only restore if database is completely empty AND backups exist
-    if total_records == 0:
-        backup_dir = "/app/backups"
-        has_backups = os.path.exists(backup_dir) and len([d for d in os.listdir(backup_dir) if d.startswith("backup_")]) > 0
+# MongoDB collections (async Motor driver, see database.py)
+from database import (
+    client,
+    db,
+    ping,
+    users_collection,
+    papers_collection,
+    notes_collection,
+    syllabus_collection,
+    chat_messages_collection,
+    bookmarks_collection,
+    achievements_collection,
+    learning_goals_collection,
+    downloads_collection,
+    forum_posts_collection,
+    forum_replies_collection,
+    user_stats_collection,
+    counters_collection,
+    user_cache_invalidations_collection,
+)
+
+# Bookmarks/downloads store the resource type; map it to its collection
+RESOURCE_COLLECTIONS = {
+    "paper": papers_collection,
+    "note": notes_collection,
+    "syllabus": syllabus_collection,
+}
+from migrations import run_migrations, index_report, current_version
+from jobs import author_snapshot, reconcile_forum, reconcile_user_stats, reconcile_site_counters, recompute_achievements, SITE_COUNTERS
+from serialization import (
+    FastJSONResponse,
+    RESOURCE_PROJECTION,
+    SYLLABUS_PROJECTION,
+    FORUM_POST_PROJECTION,
+    resource_row,
+    forum_post_row,
+)
+from search_index import SearchIndex, DOC_TYPES
+from facets import FacetCounts
+from download_buffer import DownloadBuffer, DOWNLOAD_FLUSH_INTERVAL
+from achievements import AchievementEngine, ACHIEVEMENT_INTERVAL
+from view_counter import ViewCounter, VIEW_FLUSH_INTERVAL
+from text_extraction import claim, extract_resource, backfill, load_body_terms, delete_extracted, shutdown_pool
+from user_cache import UserCache, USER_CACHE_POLL_INTERVAL
+from file_delivery import file_response, starts_file
+from blob_store import store_upload, store_file, release, release_file, blob_report
+from resumable_uploads import (
+    create_session,
+    load_session,
+    locked_session,
+    append_chunk,
+    save_meta,
+    remove_session,
+    collect_expired,
+    SessionNotFound,
+    SessionBusy,
+    OffsetMismatch,
+    ChunkTooLarge,
+    UPLOAD_SESSION_GC_INTERVAL,
+)
+from password_hashing import PasswordHasher, HasherBusy, BCRYPT_SETTINGS_REFRESH
+
+# In-memory full-text index and facet counts over papers, notes and syllabus
+# (see search_index.py / facets.py)
+search_index = SearchIndex()
+facet_counts = FacetCounts()
+# changes is a log of updates made while a rebuild runs, None otherwise
+search_state = {"built_at": None, "changes": None}
+
+async def verify_database():
+    """Ping MongoDB and auto-restore from backup if the database is empty"""
+    try:
+        # Quick ping to check if DB is alive
+        await ping()
+        print("✓ MongoDB connected successfully")
         
-        if has_backups:
-            print("⚠️  DATABASE IS EMPTY! Auto-restoring from backup...")
-            try:
-                result = subprocess.run(
-                    ["bash", "/app/scripts/emergency_protection.sh"],
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                print(result.stdout)
-                if result.returncode == 0:
-                    print("✅ DATA RESTORED SUCCESSFULLY!")
-                else:
-                    print(f"⚠️  Restore warning: {result.stderr}")
-            except Exception as restore_error:
-                print(f"⚠️  Auto-restore failed: {restore_error}")
-        else:
-            print("✓ Fresh database - no backups to restore from")
-    else:
-        print(f"✓ Database OK - {total_records} records")
+        # BULLETPROOF DATA PROTECTION: Auto-restore ONLY if completely empty
+        import subprocess
         
-except Exception as e:
-    print(f"✗ MongoDB connection error: {e}")
+        # Check if database has ANY data
+        total_records = (
+            await users_collection.count_documents({}) +
+            await papers_collection.count_documents({}) +
+            await notes_collection.count_documents({}) +
+            await syllabus_collection.count_documents({})
+        )
+        
+        # Only restore if database is completely empty AND backups exist
+        if total_records == 0:
+            backup_dir = "/app/backups"
+            has_backups = os.path.exists(backup_dir) and len([d for d in os.listdir(backup_dir) if d.startswith("backup_")]) > 0
+            
+            if has_backups:
+                print("⚠️  DATABASE IS EMPTY! Auto-restoring from backup...")
+                try:
+                    # Run the restore script off the event loop
+                    result = await asyncio.to_thread(
+                        subprocess.run,
+                        ["bash", "/app/scripts/emergency_protection.sh"],
+                        capture_output=True,
+                        text=True,
+                        timeout=30
+                    )
+                    print(result.stdout)
+                    if result.returncode == 0:
+                        print("✅ DATA RESTORED SUCCESSFULLY!")
+                    else:
+                        print(f"⚠️  Restore warning: {result.stderr}")
+                except Exception as restore_error:
+                    print(f"⚠️  Auto-restore failed: {restore_error}")
+            else:
+                print("✓ Fresh database - no backups to restore from")
+        else:
+            print(f"✓ Database OK - {total_records} records")
+            
+    except Exception as e:
+        print(f"✗ MongoDB connection error: {e}")
 
 # Request/Response models
 class UserCreate(BaseModel):
@@ -164,6 +240,16 @@ class SyllabusResponse(ResourceBase):
     uploaded_by: str
     created_at: datetime
 
+class UploadSessionCreate(BaseModel):
+    resource_type: str  # paper, note or syllabus
+    filename: str
+    size: int  # total bytes the client will send
+    title: str
+    branch: str
+    year: Optional[str] = None  # syllabus only
+    description: str = ""
+    tags: str = ""
+
 class Stats(BaseModel):
     total_papers: int
     total_notes: int
@@ -263,6 +349,7 @@ class ForumPost(BaseModel):
     author_name: str
     replies_count: int
     views: int
+    unique_viewers: int = 0  # HyperLogLog estimate, see view_counter.py
     created_at: datetime
     updated_at: datetime
     last_activity: datetime
@@ -270,11 +357,25 @@ class ForumPost(BaseModel):
 
 
 # Helper functions for auth
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# bcrypt runs on a bounded thread pool (see password_hashing.py) so logins
+# never stall the event loop; a full queue is answered with 429
+password_hasher = PasswordHasher(pwd_context)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def run_hasher(operation, *args):
+    try:
+        return await operation(*args)
+    except HasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many sign-in requests right now, please retry in a moment",
+            headers={"Retry-After": "1"},
+        )
+
+async def verify_password(plain_password, hashed_password):
+    return await run_hasher(password_hasher.verify, plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await run_hasher(password_hasher.hash, password)
 
 def create_access_token(data, expires_delta=None):
     to_encode = data.copy()
@@ -285,7 +386,11 @@ def create_access_token(data, expires_delta=None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# Resolved users for get_current_user (see user_cache.py) - call
+# user_cache.invalidate() after any write to a field of the User model
+user_cache = UserCache(users_collection, user_cache_invalidations_collection)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # Standard auth exception
     auth_error = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -302,8 +407,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     except JWTError:
         raise auth_error
     
-    # Fetch user from DB
-    user = users_collection.find_one({"_id": user_id})
+    user = await user_cache.get(user_id)
     if not user:
         raise auth_error
     
@@ -327,21 +431,163 @@ def get_current_admin_user(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
-async def save_upload_file(upload_file, destination):
-    """Saves uploaded file and returns path"""
+def upload_too_large(e):
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File is larger than the {e.max_bytes // (1024 * 1024)} MB upload limit"
+    )
+
+async def save_upload_file(upload_file, destination, max_bytes=MAX_UPLOAD_BYTES):
+    """Streams the upload to disk (see file_storage.py); returns (path, sha256, size)"""
     file_path = f"{destination}/{uuid.uuid4()}-{upload_file.filename}"
     
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await upload_file.read()
-        await f.write(content)
+    try:
+        file_sha256, file_size = await stream_to_file(upload_file, file_path, max_bytes)
+    except UploadTooLarge as e:
+        raise upload_too_large(e)
     
-    return file_path
+    return file_path, file_sha256, file_size
+
+async def save_resource_file(upload_file):
+    """Streams a resource PDF into the deduplicating blob store (see blob_store.py);
+    returns (path, sha256, size) - release it with release_file() on delete"""
+    try:
+        return await store_upload(db, upload_file)
+    except UploadTooLarge as e:
+        raise upload_too_large(e)
+
+async def resource_file_response(request, doc, filename=None):
+    """The resource's PDF with ETag/Last-Modified, 304s and byte ranges (see
+    file_delivery.py) - inline, or as an attachment when `filename` is given"""
+    try:
+        return await file_response(
+            request,
+            doc["file_path"],
+            "application/pdf",
+            content_hash=doc.get("file_sha256"),
+            filename=filename,
+            disposition="attachment" if filename else "inline",
+            cache_control="private, no-cache" if filename else "no-cache"
+        )
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+
+def parse_tags(tags):
+    """Comma-separated form value -> list of tags"""
+    return [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
+
+# Per resource type: /api/stats counter and upload response message
+RESOURCE_UPLOADS = {
+    "paper": ("total_papers", "Paper uploaded successfully"),
+    "note": ("total_notes", "Notes uploaded successfully"),
+    "syllabus": ("total_syllabus", "Syllabus uploaded successfully"),
+}
+
+async def create_resource(resource_type, fields, stored_file, current_user, background_tasks, resource_id=None):
+    """Insert a paper/note/syllabus for a file already in the blob store and update
+    counters, search and achievements - shared by the form and resumable uploads"""
+    file_path, file_sha256, file_size = stored_file
+    resource_id = resource_id or str(uuid.uuid4())
+    doc = {
+        "_id": resource_id,
+        **fields,
+        "file_path": file_path,
+        "file_sha256": file_sha256,
+        "file_size": file_size,
+        "uploaded_by": current_user.id,
+        "created_at": datetime.utcnow(),
+        "text_status": "pending"
+    }
+    
+    counter, message = RESOURCE_UPLOADS[resource_type]
+    collection = RESOURCE_COLLECTIONS[resource_type]
+    try:
+        await collection.insert_one(doc)
+    except BaseException:
+        # The blob reference was taken for this doc - give it back if the doc isn't there
+        if not await collection.find_one({"_id": resource_id}, {"_id": 1}):
+            await release(db, file_sha256)
+        raise
+    await bump_counter(counter, 1)
+    update_search_index("add", resource_type, resource_row(doc))
+    # PDF text is extracted after the response is sent
+    background_tasks.add_task(extract_upload_text, resource_type, resource_id)
+    
+    await bump_user_stats(current_user.id, uploads=1)
+    achievement_engine.emit(current_user.id, "upload")
+    
+    return {"message": message, "id": resource_id}
+
+## Keyset pagination helpers
+def encode_cursor(doc):
+    """Opaque cursor pointing just past `doc` in (created_at, _id) order"""
+    raw = json.dumps({"t": doc["created_at"].isoformat(), "id": doc["_id"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(data["t"]), data["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def resource_query(branch=None, tags=None, year=None, cursor=None):
+    """Build the Mongo filter for a resource list page"""
+    query = {}
+    if branch:
+        query["branch"] = branch
+    if year:
+        query["year"] = year
+    if tags:
+        tags_list = [tag.strip() for tag in tags.split(",") if tag.strip()]
+        if tags_list:
+            query["tags"] = {"$all": tags_list}
+    if cursor:
+        query.update(keyset_condition(cursor))
+    return query
+
+def keyset_condition(cursor):
+    """Filter for rows after `cursor` - seeks straight to the page via the
+    (created_at, _id) index instead of skipping rows"""
+    created_at, last_id = decode_cursor(cursor)
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": last_id}}
+    ]}
+
+async def fetch_page(collection, query, limit, projection=None):
+    """Newest-first docs matching `query`, plus the cursor for the next page (or None)"""
+    cursor = collection.find(query, projection).sort([("created_at", -1), ("_id", -1)])
+    if limit is None:
+        return await cursor.to_list(length=None), None
+    
+    # Fetch one extra row to know whether another page exists
+    docs = await cursor.limit(limit + 1).to_list(length=limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1])
+    return docs, None
+
+def resource_page_response(docs, next_cursor):
+    """Serialize a resource page on the fast path (see serialization.py)"""
+    return page_response([resource_row(doc) for doc in docs], next_cursor)
+
+def page_response(rows, next_cursor):
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(rows, headers=headers)
 
 ## Auth routes
 @app.post("/api/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
     # Make sure email isn't already taken
-    if users_collection.find_one({"email": user_data.email}):
+    if await users_collection.find_one({"email": user_data.email}):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -349,7 +595,7 @@ async def register(user_data: UserCreate):
     
     # Create new user doc
     user_id = str(uuid.uuid4())
-    hashed_pw = get_password_hash(user_data.password)
+    hashed_pw = await get_password_hash(user_data.password)
     
     user_doc = {
         "_id": user_id,
@@ -363,7 +609,9 @@ async def register(user_data: UserCreate):
         "created_at": datetime.utcnow()
     }
     
-    users_collection.insert_one(user_doc)
+    await users_collection.insert_one(user_doc)
+    await bump_counter("total_users", 1)
+    achievement_engine.emit(user_id, "register")
     
     # Generate token for immediate login
     token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -386,16 +634,26 @@ async def register(user_data: UserCreate):
 
 @app.post("/api/auth/login", response_model=Token)
 async def login(login_data: UserLogin):
-    user = users_collection.find_one({"email": login_data.email})
+    user = await users_collection.find_one({"email": login_data.email})
     
     # Check if user exists and password matches
-    if not user or not verify_password(login_data.password, user["password"]):
+    if user:
+        matches, new_hash = await run_hasher(password_hasher.verify_and_update, login_data.password, user["password"])
+    if not user or not matches:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Stored hash uses an old bcrypt cost - swap in the rehash, unless the
+    # password changed meanwhile
+    if new_hash:
+        await users_collection.update_one(
+            {"_id": user["_id"], "password": user["password"]},
+            {"$set": {"password": new_hash}}
+        )
+    
     # Create JWT token
     token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -417,24 +675,20 @@ async def login(login_data: UserLogin):
 
 ## Papers API
 @app.get("/api/papers", response_model=List[PaperResponse])
-async def get_papers():
-    # Get all papers sorted by newest first
-    papers = []
-    for paper in papers_collection.find().sort("created_at", -1):
-        papers.append(PaperResponse(
-            id=paper["_id"],
-            title=paper["title"],
-            branch=paper["branch"],
-            description=paper.get("description", ""),
-            tags=paper.get("tags", []),
-            file_path=paper["file_path"],
-            uploaded_by=paper["uploaded_by"],
-            created_at=paper["created_at"]
-        ))
-    return papers
+async def get_papers(
+    branch: Optional[str] = None,
+    tags: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    # Newest first; pass `limit` and the X-Next-Cursor value to page through
+    query = resource_query(branch=branch, tags=tags, cursor=cursor)
+    docs, next_cursor = await fetch_page(papers_collection, query, limit, RESOURCE_PROJECTION)
+    return resource_page_response(docs, next_cursor)
 
 @app.post("/api/papers")
 async def create_paper(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     branch: str = Form(...),
     description: str = Form(""),
@@ -450,37 +704,18 @@ async def create_paper(
         )
     
     # Save the uploaded file
-    file_path = await save_upload_file(file, f"{UPLOAD_DIR}/papers")
-    
-    # Convert comma-separated tags to list
-    tags_list = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
-    
-    # Create paper doc
-    paper_id = str(uuid.uuid4())
-    paper_doc = {
-        "_id": paper_id,
-        "title": title,
-        "branch": branch,
-        "description": description,
-        "tags": tags_list,
-        "file_path": file_path,
-        "uploaded_by": current_user.id,
-        "created_at": datetime.utcnow()
-    }
-    
-    papers_collection.insert_one(paper_doc)
-    
-    # Give user contributor badge
-    await check_and_award_achievement(current_user.id, "contributor")
+    stored_file = await save_resource_file(file)
     
-    return {"message": "Paper uploaded successfully", "id": paper_id}
+    fields = {"title": title, "branch": branch, "description": description, "tags": parse_tags(tags)}
+    return await create_resource("paper", fields, stored_file, current_user, background_tasks)
 
 @app.delete("/api/papers/{paper_id}")
 async def delete_paper(
     paper_id: str,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user)
 ):
-    paper = papers_collection.find_one({"_id": paper_id})
+    paper = await papers_collection.find_one({"_id": paper_id})
     
     if not paper:
         raise HTTPException(
@@ -495,19 +730,22 @@ async def delete_paper(
             detail="Not enough permissions"
         )
     
-    # Try to delete the file (might fail if file is missing, that's ok)
-    try:
-        os.remove(paper["file_path"])
-    except OSError:
-        pass
-    
-    papers_collection.delete_one({"_id": paper_id})
+    result = await papers_collection.delete_one({"_id": paper_id})
+    if result.deleted_count:
+        # Identical uploads share one file - it's only unlinked with its last reference
+        await release_file(db, paper)
+        await bump_counter("total_papers", -1)
+        await bump_user_stats(paper["uploaded_by"], uploads=-1)
+    update_search_index("remove", "paper", paper_id)
+    # Remove bookmarks of it after the response is sent
+    background_tasks.add_task(delete_resource_bookmarks, "paper", paper_id)
+    background_tasks.add_task(delete_resource_chunks, "paper", paper_id)
     
     return {"message": "Paper deleted successfully"}
 
 @app.get("/api/papers/{paper_id}/download")
-async def download_paper(paper_id: str, current_user: User = Depends(get_current_user)):
-    paper = papers_collection.find_one({"_id": paper_id})
+async def download_paper(paper_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    paper = await papers_collection.find_one({"_id": paper_id})
     
     if not paper:
         raise HTTPException(
@@ -515,24 +753,16 @@ async def download_paper(paper_id: str, current_user: User = Depends(get_current
             detail="Paper not found"
         )
     
-    if not os.path.exists(paper["file_path"]):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
-        )
-    
-    # Track the download
-    await track_download(current_user.id, "paper", paper_id)
+    response = await resource_file_response(request, paper, filename=f"{paper['title']}.pdf")
+    # Revalidations (304) and later pages fetched by range aren't new downloads
+    if starts_file(response):
+        track_download(current_user.id, "paper", paper_id)
     
-    return FileResponse(
-        path=paper["file_path"],
-        filename=f"{paper['title']}.pdf",
-        media_type="application/pdf"
-    )
+    return response
 
 @app.get("/api/papers/{paper_id}/view")
-async def view_paper(paper_id: str):
-    paper = papers_collection.find_one({"_id": paper_id})
+async def view_paper(paper_id: str, request: Request):
+    paper = await papers_collection.find_one({"_id": paper_id})
     
     if not paper:
         raise HTTPException(
@@ -540,37 +770,23 @@ async def view_paper(paper_id: str):
             detail="Paper not found"
         )
     
-    if not os.path.exists(paper["file_path"]):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
-        )
-    
-    return FileResponse(
-        path=paper["file_path"],
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline"}
-    )
+    return await resource_file_response(request, paper)
 
 # Notes Endpoints
 @app.get("/api/notes", response_model=List[NoteResponse])
-async def get_notes():
-    notes = []
-    for note in notes_collection.find().sort("created_at", -1):
-        notes.append(NoteResponse(
-            id=note["_id"],
-            title=note["title"],
-            branch=note["branch"],
-            description=note.get("description", ""),
-            tags=note.get("tags", []),
-            file_path=note["file_path"],
-            uploaded_by=note["uploaded_by"],
-            created_at=note["created_at"]
-        ))
-    return notes
+async def get_notes(
+    branch: Optional[str] = None,
+    tags: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    query = resource_query(branch=branch, tags=tags, cursor=cursor)
+    docs, next_cursor = await fetch_page(notes_collection, query, limit, RESOURCE_PROJECTION)
+    return resource_page_response(docs, next_cursor)
 
 @app.post("/api/notes")
 async def create_note(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     branch: str = Form(...),
     description: str = Form(""),
@@ -586,37 +802,18 @@ async def create_note(
         )
     
     # Save file
-    file_path = await save_upload_file(file, f"{UPLOAD_DIR}/notes")
-    
-    # Parse tags
-    tags_list = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
-    
-    # Create note document
-    note_id = str(uuid.uuid4())
-    note_doc = {
-        "_id": note_id,
-        "title": title,
-        "branch": branch,
-        "description": description,
-        "tags": tags_list,
-        "file_path": file_path,
-        "uploaded_by": current_user.id,
-        "created_at": datetime.utcnow()
-    }
-    
-    notes_collection.insert_one(note_doc)
-    
-    # Award contributor achievement
-    await check_and_award_achievement(current_user.id, "contributor")
+    stored_file = await save_resource_file(file)
     
-    return {"message": "Notes uploaded successfully", "id": note_id}
+    fields = {"title": title, "branch": branch, "description": description, "tags": parse_tags(tags)}
+    return await create_resource("note", fields, stored_file, current_user, background_tasks)
 
 @app.delete("/api/notes/{note_id}")
 async def delete_note(
     note_id: str,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user)
 ):
-    note = notes_collection.find_one({"_id": note_id})
+    note = await notes_collection.find_one({"_id": note_id})
     
     if not note:
         raise HTTPException(
@@ -631,20 +828,23 @@ async def delete_note(
             detail="Not enough permissions"
         )
     
-    # Delete file
-    try:
-        os.remove(note["file_path"])
-    except OSError:
-        pass  # File might not exist
-    
     # Delete document
-    notes_collection.delete_one({"_id": note_id})
+    result = await notes_collection.delete_one({"_id": note_id})
+    if result.deleted_count:
+        # Identical uploads share one file - it's only unlinked with its last reference
+        await release_file(db, note)
+        await bump_counter("total_notes", -1)
+        await bump_user_stats(note["uploaded_by"], uploads=-1)
+    update_search_index("remove", "note", note_id)
+    # Remove bookmarks of it after the response is sent
+    background_tasks.add_task(delete_resource_bookmarks, "note", note_id)
+    background_tasks.add_task(delete_resource_chunks, "note", note_id)
     
     return {"message": "Note deleted successfully"}
 
 @app.get("/api/notes/{note_id}/download")
-async def download_note(note_id: str, current_user: User = Depends(get_current_user)):
-    note = notes_collection.find_one({"_id": note_id})
+async def download_note(note_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    note = await notes_collection.find_one({"_id": note_id})
     
     if not note:
         raise HTTPException(
@@ -652,24 +852,16 @@ async def download_note(note_id: str, current_user: User = Depends(get_current_u
             detail="Note not found"
         )
     
-    if not os.path.exists(note["file_path"]):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
-        )
-    
-    # Track the download
-    await track_download(current_user.id, "note", note_id)
+    response = await resource_file_response(request, note, filename=f"{note['title']}.pdf")
+    # Revalidations (304) and later pages fetched by range aren't new downloads
+    if starts_file(response):
+        track_download(current_user.id, "note", note_id)
     
-    return FileResponse(
-        path=note["file_path"],
-        filename=f"{note['title']}.pdf",
-        media_type="application/pdf"
-    )
+    return response
 
 @app.get("/api/notes/{note_id}/view")
-async def view_note(note_id: str):
-    note = notes_collection.find_one({"_id": note_id})
+async def view_note(note_id: str, request: Request):
+    note = await notes_collection.find_one({"_id": note_id})
     
     if not note:
         raise HTTPException(
@@ -677,38 +869,24 @@ async def view_note(note_id: str):
             detail="Note not found"
         )
     
-    if not os.path.exists(note["file_path"]):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
-        )
-    
-    return FileResponse(
-        path=note["file_path"],
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline"}
-    )
+    return await resource_file_response(request, note)
 
 # Syllabus Endpoints
 @app.get("/api/syllabus", response_model=List[SyllabusResponse])
-async def get_syllabus():
-    syllabus_list = []
-    for syllabus in syllabus_collection.find().sort("created_at", -1):
-        syllabus_list.append(SyllabusResponse(
-            id=syllabus["_id"],
-            title=syllabus["title"],
-            branch=syllabus["branch"],
-            year=syllabus["year"],
-            description=syllabus.get("description", ""),
-            tags=syllabus.get("tags", []),
-            file_path=syllabus["file_path"],
-            uploaded_by=syllabus["uploaded_by"],
-            created_at=syllabus["created_at"]
-        ))
-    return syllabus_list
+async def get_syllabus(
+    branch: Optional[str] = None,
+    year: Optional[str] = None,
+    tags: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    query = resource_query(branch=branch, tags=tags, year=year, cursor=cursor)
+    docs, next_cursor = await fetch_page(syllabus_collection, query, limit, SYLLABUS_PROJECTION)
+    return resource_page_response(docs, next_cursor)
 
 @app.post("/api/syllabus")
 async def create_syllabus(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     branch: str = Form(...),
     year: str = Form(...),
@@ -725,38 +903,18 @@ async def create_syllabus(
         )
     
     # Save file
-    file_path = await save_upload_file(file, f"{UPLOAD_DIR}/syllabus")
-    
-    # Parse tags
-    tags_list = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
-    
-    # Create syllabus document
-    syllabus_id = str(uuid.uuid4())
-    syllabus_doc = {
-        "_id": syllabus_id,
-        "title": title,
-        "branch": branch,
-        "year": year,
-        "description": description,
-        "tags": tags_list,
-        "file_path": file_path,
-        "uploaded_by": current_user.id,
-        "created_at": datetime.utcnow()
-    }
-    
-    syllabus_collection.insert_one(syllabus_doc)
+    stored_file = await save_resource_file(file)
     
-    # Award contributor achievement
-    await check_and_award_achievement(current_user.id, "contributor")
-    
-    return {"message": "Syllabus uploaded successfully", "id": syllabus_id}
+    fields = {"title": title, "branch": branch, "year": year, "description": description, "tags": parse_tags(tags)}
+    return await create_resource("syllabus", fields, stored_file, current_user, background_tasks)
 
 @app.delete("/api/syllabus/{syllabus_id}")
 async def delete_syllabus(
     syllabus_id: str,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user)
 ):
-    syllabus = syllabus_collection.find_one({"_id": syllabus_id})
+    syllabus = await syllabus_collection.find_one({"_id": syllabus_id})
     
     if not syllabus:
         raise HTTPException(
@@ -771,20 +929,23 @@ async def delete_syllabus(
             detail="Not enough permissions"
         )
     
-    # Delete file
-    try:
-        os.remove(syllabus["file_path"])
-    except OSError:
-        pass  # File might not exist
-    
     # Delete document
-    syllabus_collection.delete_one({"_id": syllabus_id})
+    result = await syllabus_collection.delete_one({"_id": syllabus_id})
+    if result.deleted_count:
+        # Identical uploads share one file - it's only unlinked with its last reference
+        await release_file(db, syllabus)
+        await bump_counter("total_syllabus", -1)
+        await bump_user_stats(syllabus["uploaded_by"], uploads=-1)
+    update_search_index("remove", "syllabus", syllabus_id)
+    # Remove bookmarks of it after the response is sent
+    background_tasks.add_task(delete_resource_bookmarks, "syllabus", syllabus_id)
+    background_tasks.add_task(delete_resource_chunks, "syllabus", syllabus_id)
     
     return {"message": "Syllabus deleted successfully"}
 
 @app.get("/api/syllabus/{syllabus_id}/download")
-async def download_syllabus(syllabus_id: str, current_user: User = Depends(get_current_user)):
-    syllabus = syllabus_collection.find_one({"_id": syllabus_id})
+async def download_syllabus(syllabus_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    syllabus = await syllabus_collection.find_one({"_id": syllabus_id})
     
     if not syllabus:
         raise HTTPException(
@@ -792,24 +953,16 @@ async def download_syllabus(syllabus_id: str, current_user: User = Depends(get_c
             detail="Syllabus not found"
         )
     
-    if not os.path.exists(syllabus["file_path"]):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
-        )
+    response = await resource_file_response(request, syllabus, filename=f"{syllabus['title']}.pdf")
+    # Revalidations (304) and later pages fetched by range aren't new downloads
+    if starts_file(response):
+        track_download(current_user.id, "syllabus", syllabus_id)
     
-    # Track the download
-    await track_download(current_user.id, "syllabus", syllabus_id)
-    
-    return FileResponse(
-        path=syllabus["file_path"],
-        filename=f"{syllabus['title']}.pdf",
-        media_type="application/pdf"
-    )
+    return response
 
 @app.get("/api/syllabus/{syllabus_id}/view")
-async def view_syllabus(syllabus_id: str):
-    syllabus = syllabus_collection.find_one({"_id": syllabus_id})
+async def view_syllabus(syllabus_id: str, request: Request):
+    syllabus = await syllabus_collection.find_one({"_id": syllabus_id})
     
     if not syllabus:
         raise HTTPException(
@@ -817,32 +970,280 @@ async def view_syllabus(syllabus_id: str):
             detail="Syllabus not found"
         )
     
-    if not os.path.exists(syllabus["file_path"]):
+    return await resource_file_response(request, syllabus)
+
+## Resumable uploads
+# Large PDFs over flaky connections: open a session, PUT chunks at
+# ?offset=, GET the session to find where to resume, then complete it
+# (see resumable_uploads.py)
+def upload_session_error(e):
+    if isinstance(e, OffsetMismatch):
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload is at offset {e.offset}",
+            headers={"Upload-Offset": str(e.offset)}
+        )
+    if isinstance(e, SessionBusy):
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another request is writing this upload"
+        )
+    if isinstance(e, ChunkTooLarge):
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Chunk goes past the declared file size"
+        )
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Upload session not found"
+    )
+
+UPLOAD_SESSION_ERRORS = (SessionNotFound, SessionBusy, OffsetMismatch, ChunkTooLarge)
+
+@app.post("/api/uploads")
+async def create_upload_session(
+    upload: UploadSessionCreate,
+    current_user: User = Depends(get_current_user)
+):
+    if upload.resource_type not in RESOURCE_UPLOADS:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="resource_type must be paper, note or syllabus"
+        )
+    if not upload.filename.endswith('.pdf'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only PDF files are allowed"
+        )
+    if upload.resource_type == "syllabus" and not upload.year:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="year is required for syllabus"
+        )
+    if upload.size <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="size must be positive"
+        )
+    if upload.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File is larger than the {MAX_UPLOAD_MB} MB upload limit"
         )
     
-    return FileResponse(
-        path=syllabus["file_path"],
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline"}
-    )
+    session = await create_session(current_user.id, upload.size, upload.model_dump(exclude={"size"}))
+    return session.status()
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload_session(upload_id: str, current_user: User = Depends(get_current_user)):
+    """Bytes received so far - resume PUTs from `offset`"""
+    try:
+        session = await load_session(upload_id, current_user.id)
+    except UPLOAD_SESSION_ERRORS as e:
+        raise upload_session_error(e)
+    return session.status()
+
+@app.put("/api/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user: User = Depends(get_current_user)
+):
+    """Append the raw request body at `offset` (must equal the bytes received so far)"""
+    try:
+        received = await append_chunk(upload_id, current_user.id, offset, request.stream())
+    except UPLOAD_SESSION_ERRORS as e:
+        raise upload_session_error(e)
+    return {"upload_id": upload_id, "offset": received}
+
+@app.post("/api/uploads/{upload_id}/complete")
+async def complete_upload_session(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user)
+):
+    """Turn a fully received upload into a paper/note/syllabus"""
+    try:
+        async with locked_session(upload_id, current_user.id) as session:
+            if session.offset != session.size:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Upload incomplete: {session.offset} of {session.size} bytes received",
+                    headers={"Upload-Offset": str(session.offset)}
+                )
+            upload = session.meta["metadata"]
+            resource_type = upload["resource_type"]
+            # The id is fixed before the resource is created, so a retry after a
+            # timeout or a crash returns that resource instead of making another
+            resource_id = session.meta.get("resource_id")
+            if resource_id and await RESOURCE_COLLECTIONS[resource_type].find_one({"_id": resource_id}, {"_id": 1}):
+                response = {"message": RESOURCE_UPLOADS[resource_type][1], "id": resource_id}
+            else:
+                if not resource_id:
+                    session.meta["resource_id"] = resource_id = str(uuid.uuid4())
+                    await save_meta(session)
+                fields = {"title": upload["title"], "branch": upload["branch"]}
+                if resource_type == "syllabus":
+                    fields["year"] = upload["year"]
+                fields.update(description=upload["description"], tags=parse_tags(upload["tags"]))
+                # The session keeps its copy until the resource exists, so a failure here
+                # leaves the upload complete and the client can call this again
+                stored_file = await store_file(db, session.data_path)
+                response = await create_resource(
+                    resource_type, fields, stored_file, current_user, background_tasks, resource_id=resource_id
+                )
+    except UPLOAD_SESSION_ERRORS as e:
+        raise upload_session_error(e)
+    
+    await remove_session(upload_id)
+    return response
+
+@app.delete("/api/uploads/{upload_id}")
+async def cancel_upload_session(upload_id: str, current_user: User = Depends(get_current_user)):
+    try:
+        async with locked_session(upload_id, current_user.id):
+            await remove_session(upload_id)
+    except UPLOAD_SESSION_ERRORS as e:
+        raise upload_session_error(e)
+    return {"message": "Upload cancelled"}
+
+## Site counters
+# Last /api/stats payload and when it goes stale (per worker)
+stats_cache = {"stats": None, "expires": 0.0}
+
+async def bump_counter(metric, delta):
+    """$inc a site-wide counter and drop this worker's cached stats"""
+    await counters_collection.update_one({"_id": metric}, {"$inc": {"value": delta}}, upsert=True)
+    stats_cache["stats"] = None
 
-# Stats Endpoint
 @app.get("/api/stats", response_model=Stats)
 async def get_stats():
-    total_papers = papers_collection.count_documents({})
-    total_notes = notes_collection.count_documents({})
-    total_syllabus = syllabus_collection.count_documents({})
-    total_users = users_collection.count_documents({})
-    
-    return Stats(
-        total_papers=total_papers,
-        total_notes=total_notes,
-        total_syllabus=total_syllabus,
-        total_users=total_users
-    )
+    # One read of the counters docs, cached for STATS_CACHE_TTL seconds
+    if stats_cache["stats"] is None or time.monotonic() >= stats_cache["expires"]:
+        stats = dict.fromkeys(SITE_COUNTERS, 0)
+        async for counter in counters_collection.find({"_id": {"$in": list(SITE_COUNTERS)}}):
+            stats[counter["_id"]] = max(counter["value"], 0)
+        stats_cache["stats"] = stats
+        stats_cache["expires"] = time.monotonic() + STATS_CACHE_TTL
+    return FastJSONResponse(stats_cache["stats"])
+
+## Search
+async def build_search_index():
+    """Load every resource into a fresh SearchIndex and FacetCounts and swap them in.
+    PDF body terms are read in full only on the first build; later rebuilds keep
+    the current index's and load just those stored since the last build."""
+    global search_index, facet_counts
+    started = datetime.utcnow()
+    since = search_state["built_at"]
+    # Uploads and deletes while we read may or may not be in the snapshot -
+    # they're logged and replayed onto the new index before the swap
+    search_state["changes"] = changes = []
+    try:
+        bodies = await load_body_terms(db, since=since - SEARCH_BODY_SKEW if since else None)
+        items = []
+        for resource_type, collection in RESOURCE_COLLECTIONS.items():
+            projection = SYLLABUS_PROJECTION if resource_type == "syllabus" else RESOURCE_PROJECTION
+            async for doc in collection.find({}, projection):
+                body = bodies.get((resource_type, doc["_id"])) or search_index.body(resource_type, doc["_id"])
+                items.append((resource_type, resource_row(doc), body))
+        
+        # Tokenizing 100k docs takes seconds - keep it off the event loop
+        index = SearchIndex()
+        await asyncio.to_thread(index.add_many, items)
+        facets = FacetCounts()
+        await asyncio.to_thread(facets.add_many, [(resource_type, row) for resource_type, row, _ in items])
+        
+        # No awaits from here to the swap, so nothing can slip in between
+        for change in changes:
+            apply_search_change(index, facets, *change)
+        search_index, facet_counts = index, facets
+        search_state["built_at"] = started
+    finally:
+        search_state["changes"] = None
+    print(f"✓ Search index built ({len(index)} resources)")
+
+def apply_search_change(index, facets, operation, resource_type, *args):
+    if operation == "add":
+        row, = args
+        index.add(resource_type, row)
+        facets.add(resource_type, row)
+    elif operation == "remove":
+        resource_id, = args
+        index.remove(resource_type, resource_id)
+        facets.remove(resource_type, resource_id)
+    elif operation == "body":
+        # Re-index with the body terms pulled out of its PDF
+        resource_id, terms = args
+        row = index.get(resource_type, resource_id)
+        if row:
+            index.add(resource_type, row, terms)
+
+def update_search_index(operation, resource_type, *args):
+    """Apply an add/remove/body change to the live search index and facets
+    (and log it for the rebuild in progress, if any)"""
+    apply_search_change(search_index, facet_counts, operation, resource_type, *args)
+    if search_state["changes"] is not None:
+        search_state["changes"].append((operation, resource_type, *args))
+
+async def index_extracted_text(resource_type, resource_id, terms):
+    """Re-index a resource with the body terms pulled out of its PDF"""
+    update_search_index("body", resource_type, resource_id, terms)
+
+async def extract_upload_text(resource_type, resource_id):
+    """Extract a fresh upload's PDF text (a crash here is picked up by the startup backfill)"""
+    doc = await claim(RESOURCE_COLLECTIONS[resource_type], resource_id)
+    if doc:
+        terms = await extract_resource(db, resource_type, doc)
+        if terms:
+            await index_extracted_text(resource_type, resource_id, terms)
+
+async def delete_resource_chunks(resource_type, resource_id):
+    await delete_extracted(db, resource_type, resource_id)
+
+async def backfill_resource_text():
+    """Extract text from every upload that doesn't have it yet"""
+    try:
+        await backfill(db, on_extracted=index_extracted_text)
+    except Exception as e:
+        print(f"⚠️  Text extraction backfill failed: {e}")
+
+@app.get("/api/search")
+async def search(
+    q: str = Query(..., min_length=1),
+    type: Optional[str] = None,
+    branch: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)
+):
+    """BM25-ranked resources matching `q` across title, description, tags and branch"""
+    if type and type not in DOC_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid resource type"
+        )
+    return FastJSONResponse(search_index.search(q, limit=limit, doc_type=type, branch=branch))
+
+# URL segment -> resource type
+FACET_TYPES = {"papers": "paper", "notes": "note", "syllabus": "syllabus"}
+
+@app.get("/api/{collection}/facets")
+async def get_facets(
+    collection: str,
+    branch: Optional[str] = None,
+    year: Optional[str] = None,
+    tags: Optional[str] = None
+):
+    """Branch / year / tag counts for a resource type, narrowed by the same filters as its list route"""
+    if collection not in FACET_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found"
+        )
+    
+    filters = [("branch", branch), ("year", year)]
+    if tags:
+        filters += [("tags", tag.strip()) for tag in tags.split(",") if tag.strip()]
+    return FastJSONResponse(facet_counts.counts(FACET_TYPES[collection], filters))
 
 ## AI Study Assistant
 @app.post("/api/ai/chat", response_model=ChatResponse)
@@ -895,7 +1296,7 @@ Keep responses helpful, educational, and encouraging. If asked about non-enginee
             "timestamp": datetime.utcnow()
         }
         
-        chat_messages_collection.insert_one(msg_doc)
+        await chat_messages_collection.insert_one(msg_doc)
         
         return ChatResponse(
             response=ai_response,
@@ -905,48 +1306,65 @@ Keep responses helpful, educational, and encouraging. If asked about non-enginee
     except Exception as e:
         print(f"AI Chat Error: {e}")
 
+## Per-user stat counters
+# user_stats keeps one doc per user with running totals so profile stats
+# never count a user's history; jobs.reconcile_user_stats repairs drift
+async def bump_user_stats(user_id, **deltas):
+    """Atomically add `deltas` (e.g. downloads=1) to a user's counters"""
+    await user_stats_collection.update_one(
+        {"_id": user_id},
+        {"$inc": deltas},
+        upsert=True
+    )
+
+async def bump_user_stats_many(deltas_by_user, field):
+    """Apply per-user deltas of one counter with a single bulk_write"""
+    ops = [
+        UpdateOne({"_id": user_id}, {"$inc": {field: delta}}, upsert=True)
+        for user_id, delta in deltas_by_user.items() if delta
+    ]
+    if ops:
+        await user_stats_collection.bulk_write(ops, ordered=False)
+
 @app.get("/api/profile/stats")
 async def get_profile_stats(current_user: User = Depends(get_current_user)):
     """Get user's profile statistics"""
-    total_downloads = downloads_collection.count_documents({"user_id": current_user.id})
-    total_bookmarks = bookmarks_collection.count_documents({"user_id": current_user.id})
-    total_goals = learning_goals_collection.count_documents({"user_id": current_user.id})
-    completed_goals = learning_goals_collection.count_documents({"user_id": current_user.id, "completed": True})
-    total_achievements = achievements_collection.count_documents({"user_id": current_user.id})
+    # Counters doc and last 10 downloads in parallel - both are single indexed reads
+    stats, downloads = await asyncio.gather(
+        user_stats_collection.find_one({"_id": current_user.id}),
+        downloads_collection.find({"user_id": current_user.id}).sort("downloaded_at", -1).limit(10).to_list(length=10)
+    )
+    stats = stats or {}
+    
+    # Resolve titles with one $in query per resource type
+    resources = await resolve_resources((download["resource_type"], download["resource_id"]) for download in downloads)
     
-    # Get recent downloads
     recent_downloads = []
-    for download in downloads_collection.find({"user_id": current_user.id}).sort("downloaded_at", -1).limit(10):
-        resource_type = download["resource_type"]
-        resource_id = download["resource_id"]
-        
-        # Get resource details
-        resource = None
-        if resource_type == "paper":
-            resource = papers_collection.find_one({"_id": resource_id})
-        elif resource_type == "note":
-            resource = notes_collection.find_one({"_id": resource_id})
-        elif resource_type == "syllabus":
-            resource = syllabus_collection.find_one({"_id": resource_id})
-        
+    for download in downloads:
+        resource = resources.get((download["resource_type"], download["resource_id"]))
         if resource:
             recent_downloads.append({
-                "type": resource_type,
+                "type": download["resource_type"],
                 "title": resource["title"],
                 "branch": resource["branch"],
                 "downloaded_at": download["downloaded_at"]
             })
     
     return {
-        "total_downloads": total_downloads,
-        "total_bookmarks": total_bookmarks,
-        "total_goals": total_goals,
-        "completed_goals": completed_goals,
-        "total_achievements": total_achievements,
+        "total_downloads": stats.get("downloads", 0),
+        "total_bookmarks": stats.get("bookmarks", 0),
+        "total_goals": stats.get("goals", 0),
+        "completed_goals": stats.get("completed_goals", 0),
+        "total_achievements": stats.get("achievements", 0),
         "recent_downloads": recent_downloads
     }
 
 ## Profile endpoints
+async def update_author_snapshots(user_id, fields):
+    """Fan a profile change out to the author snapshot on the user's forum posts and replies"""
+    await forum_posts_collection.update_many({"author_id": user_id}, {"$set": fields})
+    await forum_replies_collection.update_many({"author_id": user_id}, {"$set": fields})
+
 @app.get("/api/profile", response_model=User)
 async def get_profile(current_user: User = Depends(get_current_user)):
     """Returns current user's profile"""
@@ -964,10 +1382,12 @@ async def update_profile(
         updates["name"] = profile_data.name
     
     if updates:
-        users_collection.update_one(
+        await users_collection.update_one(
             {"_id": current_user.id},
             {"$set": updates}
         )
+        await user_cache.invalidate(current_user.id)
+        await update_author_snapshots(current_user.id, {"author.name": updates["name"]})
     
     return {"message": "Profile updated successfully"}
 
@@ -984,25 +1404,31 @@ async def upload_profile_photo(
             detail="Only image files (JPG, PNG, WebP) are allowed"
         )
     
+    # Save new photo first - a rejected upload keeps the old one
+    file_path, _, _ = await save_upload_file(file, f"{UPLOAD_DIR}/profile_photos", MAX_PROFILE_PHOTO_BYTES)
+    
     # Remove old photo if it exists
-    user_doc = users_collection.find_one({"_id": current_user.id})
+    user_doc = await users_collection.find_one({"_id": current_user.id})
     if user_doc and user_doc.get("profile_photo"):
         try:
             os.remove(user_doc["profile_photo"])
         except OSError:
             pass  # Old file might be missing, that's fine
     
-    # Save new photo
-    file_path = await save_upload_file(file, f"{UPLOAD_DIR}/profile_photos")
-    
     # Update DB
-    users_collection.update_one(
+    await users_collection.update_one(
         {"_id": current_user.id},
         {"$set": {"profile_photo": file_path}}
     )
+    await user_cache.invalidate(current_user.id)
+    await update_author_snapshots(current_user.id, {"author.profile_photo": file_path})
     
-    # Award profile completion achievement
-    await check_profile_achievements(current_user.id)
+    await user_stats_collection.update_one(
+        {"_id": current_user.id},
+        {"$set": {"profile_photo": 1}},
+        upsert=True
+    )
+    achievement_engine.emit(current_user.id, "profile_photo")
     
     return {"message": "Profile photo updated successfully", "file_path": file_path}
 
@@ -1012,21 +1438,22 @@ async def update_password(
     current_user: User = Depends(get_current_user)
 ):
     """Change user password"""
-    user = users_collection.find_one({"_id": current_user.id})
+    user = await users_collection.find_one({"_id": current_user.id})
     
     # Make sure current password is correct
-    if not verify_password(password_data.current_password, user["password"]):
+    if not await verify_password(password_data.current_password, user["password"]):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
         )
     
     # Hash and save new password
-    new_hash = get_password_hash(password_data.new_password)
-    users_collection.update_one(
+    new_hash = await get_password_hash(password_data.new_password)
+    await users_collection.update_one(
         {"_id": current_user.id},
         {"$set": {"password": new_hash}}
     )
+    await user_cache.invalidate(current_user.id)
     
     return {"message": "Password updated successfully"}
 
@@ -1035,7 +1462,7 @@ async def remove_profile_photo(
     current_user: User = Depends(get_current_user)
 ):
     """Remove profile picture"""
-    user_doc = users_collection.find_one({"_id": current_user.id})
+    user_doc = await users_collection.find_one({"_id": current_user.id})
     
     if user_doc and user_doc.get("profile_photo"):
         try:
@@ -1044,17 +1471,20 @@ async def remove_profile_photo(
             pass  # File might be missing, that's fine
     
     # Update DB - remove photo reference
-    users_collection.update_one(
+    await users_collection.update_one(
         {"_id": current_user.id},
         {"$unset": {"profile_photo": ""}}
     )
+    await user_cache.invalidate(current_user.id)
+    await update_author_snapshots(current_user.id, {"author.profile_photo": None})
+    await user_stats_collection.update_one({"_id": current_user.id}, {"$set": {"profile_photo": 0}})
     
     return {"message": "Profile photo removed successfully"}
 
 @app.get("/api/profile/photo/{user_id}")
-async def get_profile_photo(user_id: str):
+async def get_profile_photo(user_id: str, request: Request):
     """Get user profile photo"""
-    user = users_collection.find_one({"_id": user_id})
+    user = await users_collection.find_one({"_id": user_id})
     
     if not user or not user.get("profile_photo"):
         raise HTTPException(
@@ -1062,12 +1492,6 @@ async def get_profile_photo(user_id: str):
             detail="Profile photo not found"
         )
     
-    if not os.path.exists(user["profile_photo"]):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Profile photo file not found"
-        )
-    
     # Detect media type from file extension
     file_path = user["profile_photo"]
     if file_path.lower().endswith('.png'):
@@ -1079,39 +1503,93 @@ async def get_profile_photo(user_id: str):
     else:
         media_type = "image/jpeg"  # default
     
-    return FileResponse(
-        path=user["profile_photo"],
-        media_type=media_type
-    )
+    try:
+        return await file_response(request, file_path, media_type, disposition="inline")
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile photo file not found"
+        )
 
 # Bookmarks Endpoints
+async def resolve_resources(refs):
+    """Fetch title/branch for (resource_type, resource_id) pairs with one $in query per type"""
+    ids_by_type = {}
+    for resource_type, resource_id in refs:
+        ids_by_type.setdefault(resource_type, set()).add(resource_id)
+    
+    resources = {}
+    for resource_type, ids in ids_by_type.items():
+        collection = RESOURCE_COLLECTIONS.get(resource_type)
+        if collection is None:
+            continue
+        async for resource in collection.find({"_id": {"$in": list(ids)}}, {"title": 1, "branch": 1}):
+            resources[(resource_type, resource["_id"])] = resource
+    return resources
+
+async def prune_bookmarks(user_id, bookmark_ids):
+    """Drop a user's bookmarks whose resource no longer exists"""
+    result = await bookmarks_collection.delete_many({"_id": {"$in": bookmark_ids}, "user_id": user_id})
+    if result.deleted_count:
+        await bump_user_stats(user_id, bookmarks=-result.deleted_count)
+
+async def delete_resource_bookmarks(resource_type, resource_id):
+    """Cascade a resource delete to everyone's bookmarks of it"""
+    query = {"resource_type": resource_type, "resource_id": resource_id}
+    owners = {}
+    async for bookmark in bookmarks_collection.find(query, {"user_id": 1}):
+        owners[bookmark["_id"]] = bookmark["user_id"]
+    if not owners:
+        return
+    
+    await bookmarks_collection.delete_many({"_id": {"$in": list(owners)}})
+    deltas = {}
+    for user_id in owners.values():
+        deltas[user_id] = deltas.get(user_id, 0) - 1
+    await bump_user_stats_many(deltas, "bookmarks")
+
 @app.get("/api/bookmarks", response_model=List[BookmarkResponse])
-async def get_bookmarks(current_user: User = Depends(get_current_user)):
-    """Get user's bookmarks"""
-    bookmarks = []
+async def get_bookmarks(
+    background_tasks: BackgroundTasks,
+    category: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Get user's bookmarks, newest first (paged like the resource lists)"""
+    query = {"user_id": current_user.id}
+    if category:
+        query["category"] = category
+    if cursor:
+        query.update(keyset_condition(cursor))
+    
+    docs, next_cursor = await fetch_page(bookmarks_collection, query, limit)
+    resources = await resolve_resources((doc["resource_type"], doc["resource_id"]) for doc in docs)
     
-    for bookmark in bookmarks_collection.find({"user_id": current_user.id}).sort("created_at", -1):
-        # Get resource details
-        resource = None
-        if bookmark["resource_type"] == "paper":
-            resource = papers_collection.find_one({"_id": bookmark["resource_id"]})
-        elif bookmark["resource_type"] == "note":
-            resource = notes_collection.find_one({"_id": bookmark["resource_id"]})
-        elif bookmark["resource_type"] == "syllabus":
-            resource = syllabus_collection.find_one({"_id": bookmark["resource_id"]})
+    bookmarks = []
+    dangling = []
+    for bookmark in docs:
+        resource = resources.get((bookmark["resource_type"], bookmark["resource_id"]))
+        if not resource:
+            dangling.append(bookmark["_id"])
+            continue
         
-        if resource:
-            bookmarks.append(BookmarkResponse(
-                id=bookmark["_id"],
-                resource_type=bookmark["resource_type"],
-                resource_id=bookmark["resource_id"],
-                category=bookmark["category"],
-                title=resource["title"],
-                branch=resource["branch"],
-                created_at=bookmark["created_at"]
-            ))
-    
-    return bookmarks
+        bookmarks.append({
+            "id": bookmark["_id"],
+            "resource_type": bookmark["resource_type"],
+            "resource_id": bookmark["resource_id"],
+            "category": bookmark["category"],
+            "title": resource["title"],
+            "branch": resource["branch"],
+            "created_at": bookmark["created_at"]
+        })
+    
+    # Resource was deleted - clean up after the response instead of
+    # filtering the same rows out on every read
+    if dangling:
+        background_tasks.add_task(prune_bookmarks, current_user.id, dangling)
+    
+    return page_response(bookmarks, next_cursor)
 
 @app.post("/api/bookmarks")
 async def create_bookmark(
@@ -1120,7 +1598,7 @@ async def create_bookmark(
 ):
     """Create a bookmark"""
     # Check if bookmark already exists
-    existing = bookmarks_collection.find_one({
+    existing = await bookmarks_collection.find_one({
         "user_id": current_user.id,
         "resource_type": bookmark_data.resource_type,
         "resource_id": bookmark_data.resource_id
@@ -1134,12 +1612,9 @@ async def create_bookmark(
     
     # Verify resource exists
     resource = None
-    if bookmark_data.resource_type == "paper":
-        resource = papers_collection.find_one({"_id": bookmark_data.resource_id})
-    elif bookmark_data.resource_type == "note":
-        resource = notes_collection.find_one({"_id": bookmark_data.resource_id})
-    elif bookmark_data.resource_type == "syllabus":
-        resource = syllabus_collection.find_one({"_id": bookmark_data.resource_id})
+    collection = RESOURCE_COLLECTIONS.get(bookmark_data.resource_type)
+    if collection is not None:
+        resource = await collection.find_one({"_id": bookmark_data.resource_id}, {"_id": 1})
     
     if not resource:
         raise HTTPException(
@@ -1158,10 +1633,18 @@ async def create_bookmark(
         "created_at": datetime.utcnow()
     }
     
-    bookmarks_collection.insert_one(bookmark_doc)
+    try:
+        await bookmarks_collection.insert_one(bookmark_doc)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent request for the same resource
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Resource already bookmarked"
+        )
+    
+    await bump_user_stats(current_user.id, bookmarks=1)
     
-    # Check for bookmark achievements
-    await check_bookmark_achievements(current_user.id)
+    achievement_engine.emit(current_user.id, "bookmark")
     
     return {"message": "Bookmark created successfully", "id": bookmark_id}
 
@@ -1172,7 +1655,7 @@ async def remove_bookmark(
     current_user: User = Depends(get_current_user)
 ):
     """Remove a bookmark"""
-    result = bookmarks_collection.delete_one({
+    result = await bookmarks_collection.delete_one({
         "user_id": current_user.id,
         "resource_type": resource_type,
         "resource_id": resource_id
@@ -1184,6 +1667,8 @@ async def remove_bookmark(
             detail="Bookmark not found"
         )
     
+    await bump_user_stats(current_user.id, bookmarks=-1)
+    
     return {"message": "Bookmark removed successfully"}
 
 @app.get("/api/bookmarks/check/{resource_type}/{resource_id}")
@@ -1193,7 +1678,7 @@ async def check_bookmark(
     current_user: User = Depends(get_current_user)
 ):
     """Check if a resource is bookmarked"""
-    bookmark = bookmarks_collection.find_one({
+    bookmark = await bookmarks_collection.find_one({
         "user_id": current_user.id,
         "resource_type": resource_type,
         "resource_id": resource_id
@@ -1207,7 +1692,7 @@ async def get_achievements(current_user: User = Depends(get_current_user)):
     """Get user's achievements"""
     achievements = []
     
-    for achievement in achievements_collection.find({"user_id": current_user.id}).sort("earned_at", -1):
+    async for achievement in achievements_collection.find({"user_id": current_user.id}).sort("earned_at", -1):
         achievements.append(Achievement(
             id=achievement["_id"],
             name=achievement["name"],
@@ -1224,7 +1709,7 @@ async def get_learning_goals(current_user: User = Depends(get_current_user)):
     """Get user's learning goals"""
     goals = []
     
-    for goal in learning_goals_collection.find({"user_id": current_user.id}).sort("created_at", -1):
+    async for goal in learning_goals_collection.find({"user_id": current_user.id}).sort("created_at", -1):
         goals.append(LearningGoal(
             id=goal["_id"],
             title=goal["title"],
@@ -1255,10 +1740,10 @@ async def create_learning_goal(
         "created_at": datetime.utcnow()
     }
     
-    learning_goals_collection.insert_one(goal_doc)
+    await learning_goals_collection.insert_one(goal_doc)
+    await bump_user_stats(current_user.id, goals=1)
     
-    # Award achievement for first goal
-    await check_and_award_achievement(current_user.id, "goal_setter")
+    achievement_engine.emit(current_user.id, "goal_created")
     
     return {"message": "Learning goal created successfully", "id": goal_id}
 
@@ -1269,7 +1754,7 @@ async def update_learning_goal(
     current_user: User = Depends(get_current_user)
 ):
     """Update a learning goal"""
-    goal = learning_goals_collection.find_one({"_id": goal_id, "user_id": current_user.id})
+    goal = await learning_goals_collection.find_one({"_id": goal_id, "user_id": current_user.id})
     
     if not goal:
         raise HTTPException(
@@ -1292,17 +1777,18 @@ async def update_learning_goal(
             update_fields["completed"] = True
     if goal_data.completed is not None:
         update_fields["completed"] = goal_data.completed
-        # Award achievement for first completed goal
-        if goal_data.completed and not goal["completed"]:
-            await check_and_award_achievement(current_user.id, "goal_achiever")
-            # Check for additional goal achievements
-            await check_goal_achievements(current_user.id)
     
     if update_fields:
-        learning_goals_collection.update_one(
+        await learning_goals_collection.update_one(
             {"_id": goal_id},
             {"$set": update_fields}
         )
+        
+        # Keep completed_goals in step when the goal flips either way
+        if "completed" in update_fields and update_fields["completed"] != goal["completed"]:
+            await bump_user_stats(current_user.id, completed_goals=1 if update_fields["completed"] else -1)
+            if update_fields["completed"]:
+                achievement_engine.emit(current_user.id, "goal_completed")
     
     return {"message": "Learning goal updated successfully"}
 
@@ -1312,164 +1798,55 @@ async def delete_learning_goal(
     current_user: User = Depends(get_current_user)
 ):
     """Delete a learning goal"""
-    result = learning_goals_collection.delete_one({"_id": goal_id, "user_id": current_user.id})
+    goal = await learning_goals_collection.find_one_and_delete({"_id": goal_id, "user_id": current_user.id})
     
-    if result.deleted_count == 0:
+    if not goal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Learning goal not found"
         )
     
+    await bump_user_stats(current_user.id, goals=-1, completed_goals=-1 if goal["completed"] else 0)
+    
     return {"message": "Learning goal deleted successfully"}
 
 ## Achievement system helpers
-async def check_and_award_achievement(user_id, achievement_type):
-    """Awards achievement if user doesn't have it yet"""
-    # Don't award if already earned
-    existing = achievements_collection.find_one({
-        "user_id": user_id,
-        "achievement_type": achievement_type
-    })
-    
-    if existing:
-        return
-    
-    # All available achievements
-    achievements = {
-        "first_bookmark": {
-            "name": "Bookworm",
-            "description": "Created your first bookmark",
-            "icon": "📚"
-        },
-        "bookmark_collector": {
-            "name": "Bookmark Collector",
-            "description": "Saved 10+ resources to bookmarks",
-            "icon": "⭐"
-        },
-        "bookmark_master": {
-            "name": "Bookmark Master",
-            "description": "Saved 25+ resources across different categories",
-            "icon": "💫"
-        },
-        "goal_setter": {
-            "name": "Goal Setter", 
-            "description": "Set your first learning goal",
-            "icon": "🎯"
-        },
-        "goal_achiever": {
-            "name": "Goal Achiever",
-            "description": "Completed your first learning goal", 
-            "icon": "🏆"
-        },
-        "goal_master": {
-            "name": "Goal Master",
-            "description": "Completed 5+ learning goals",
-            "icon": "👑"
-        },
-        "active_learner": {
-            "name": "Active Learner",
-            "description": "Downloaded 10+ resources",
-            "icon": "📖"
-        },
-        "power_user": {
-            "name": "Power User",
-            "description": "Downloaded 50+ resources",
-            "icon": "⚡"
-        },
-        "contributor": {
-            "name": "Contributor",
-            "description": "Uploaded your first resource",
-            "icon": "📝"
-        },
-        "super_contributor": {
-            "name": "Super Contributor",
-            "description": "Uploaded 5+ resources",
-            "icon": "🌟"
-        },
-        "profile_complete": {
-            "name": "Profile Complete",
-            "description": "Added profile photo and updated information",
-            "icon": "✨"
-        },
-        "early_adopter": {
-            "name": "Early Adopter",
-            "description": "One of the first users on the platform",
-            "icon": "🚀"
-        },
-        "forum_contributor": {
-            "name": "Forum Contributor",
-            "description": "Created your first forum post",
-            "icon": "💬"
-        }
-    }
-    
-    if achievement_type not in achievements:
-        return
-    
-    ach = achievements[achievement_type]
-    
-    # Award the achievement
-    ach_id = str(uuid.uuid4())
-    ach_doc = {
-        "_id": ach_id,
-        "user_id": user_id,
-        "achievement_type": achievement_type,
-        "name": ach["name"],
-        "description": ach["description"],
-        "icon": ach["icon"],
-        "earned_at": datetime.utcnow()
-    }
-    
-    achievements_collection.insert_one(ach_doc)
+# Routes emit events; rules are evaluated off the request path (see achievements.py)
+achievement_engine = AchievementEngine(db)
 
-async def check_bookmark_achievements(user_id):
-    """Check if user earned bookmark achievements"""
-    count = bookmarks_collection.count_documents({"user_id": user_id})
-    
-    if count == 1:
-        await check_and_award_achievement(user_id, "first_bookmark")
-    elif count == 10:
-        await check_and_award_achievement(user_id, "bookmark_collector")
-    elif count == 25:
-        await check_and_award_achievement(user_id, "bookmark_master")
+async def emit_download_events(user_ids):
+    """Downloads reach user_stats on flush, so that's when their rules can be checked"""
+    for user_id in user_ids:
+        achievement_engine.emit(user_id, "download")
 
-async def check_goal_achievements(user_id):
-    """Check if user earned goal achievements"""
-    completed = learning_goals_collection.count_documents({"user_id": user_id, "completed": True})
-    
-    # Award goal master for completing 5 goals
-    if completed == 5:
-        await check_and_award_achievement(user_id, "goal_master")
+# Download events are written behind the request (see download_buffer.py)
+download_buffer = DownloadBuffer(db, on_flushed=emit_download_events)
 
-async def check_profile_achievements(user_id):
-    """Check if profile is complete"""
-    user = users_collection.find_one({"_id": user_id})
-    
-    # Award if user has uploaded profile photo
-    if user and user.get("profile_photo"):
-        await check_and_award_achievement(user_id, "profile_complete")
-
-
-async def track_download(user_id, resource_type, resource_id):
+def track_download(user_id, resource_type, resource_id):
     """Track when a user downloads a resource"""
-    download_doc = {
-        "_id": str(uuid.uuid4()),
-        "user_id": user_id,
-        "resource_type": resource_type,  # 'paper', 'note', or 'syllabus'
-        "resource_id": resource_id,
-        "downloaded_at": datetime.utcnow()
-    }
-    downloads_collection.insert_one(download_doc)
-    
-    # Check download achievements
-    total_downloads = downloads_collection.count_documents({"user_id": user_id})
-    if total_downloads == 10:
-        await check_and_award_achievement(user_id, "active_learner")
-    elif total_downloads == 50:
-        await check_and_award_achievement(user_id, "power_user")
+    download_buffer.record(user_id, resource_type, resource_id)
 
 
 ## Forum Endpoints
+def viewer_key(request, credentials):
+    """Identify a viewer for unique-view counting: user id from a valid token,
+    else the client's X-Session-Id, else client address + user agent"""
+    if credentials:
+        try:
+            user_id = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+            if user_id:
+                return f"user:{user_id}"
+        except JWTError:
+            pass
+    session_id = request.headers.get("x-session-id")
+    if session_id:
+        return f"session:{session_id}"
+    host = request.client.host if request.client else ""
+    return f"anon:{host}:{request.headers.get('user-agent', '')}"
+
+# View increments are coalesced per post and flushed in bulk (see view_counter.py)
+post_views = ViewCounter(forum_posts_collection)
+
 @app.get("/api/forum/posts", response_model=List[ForumPost])
 async def get_forum_posts(category: Optional[str] = None):
     """Get all forum posts, optionally filtered by category"""
@@ -1477,38 +1854,31 @@ async def get_forum_posts(category: Optional[str] = None):
     if category:
         query["category"] = category
     
-    posts = []
-    for post in forum_posts_collection.find(query).sort("last_activity", -1):
-        # Get author details
-        author = users_collection.find_one({"_id": post["author_id"]})
-        author_name = author["name"] if author else "Unknown User"
-        author_photo = author.get("profile_photo") if author else None
-        
-        # Count replies
-        replies_count = forum_replies_collection.count_documents({"post_id": post["_id"]})
-        
-        posts.append(ForumPost(
-            id=post["_id"],
-            title=post["title"],
-            content=post["content"],
-            category=post["category"],
-            tags=post.get("tags", []),
-            author_id=post["author_id"],
-            author_name=author_name,
-            replies_count=replies_count,
-            views=post.get("views", 0),
-            created_at=post["created_at"],
-            updated_at=post.get("updated_at", post["created_at"]),
-            last_activity=post.get("last_activity", post["created_at"]),
-            author_profile_photo=author_photo
-        ))
+    # Author and replies_count are denormalized onto the post, so this is
+    # a single indexed find with no joins
+    posts = await post_views.fetch_consistent(
+        lambda: forum_posts_collection.find(query, FORUM_POST_PROJECTION).sort("last_activity", -1).to_list(None)
+    )
+    # Plus this worker's buffered views, as on the single post route
+    rows = []
+    for post in posts:
+        post["views"] = post.get("views", 0) + post_views.pending(post["_id"])
+        rows.append(forum_post_row(post))
     
-    return posts
+    return FastJSONResponse(rows)
 
 @app.get("/api/forum/posts/{post_id}", response_model=ForumPost)
-async def get_forum_post(post_id: str):
+async def get_forum_post(
+    post_id: str,
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
     """Get a single forum post and increment views"""
-    post = forum_posts_collection.find_one({"_id": post_id})
+    # Plain read - the view is buffered and written by the periodic flush
+    post = await post_views.read(
+        post_id,
+        lambda: forum_posts_collection.find_one({"_id": post_id}, FORUM_POST_PROJECTION)
+    )
     
     if not post:
         raise HTTPException(
@@ -1516,35 +1886,9 @@ async def get_forum_post(post_id: str):
             detail="Post not found"
         )
     
-    # Increment views
-    forum_posts_collection.update_one(
-        {"_id": post_id},
-        {"$inc": {"views": 1}}
-    )
-    
-    # Get author details
-    author = users_collection.find_one({"_id": post["author_id"]})
-    author_name = author["name"] if author else "Unknown User"
-    author_photo = author.get("profile_photo") if author else None
-    
-    # Count replies
-    replies_count = forum_replies_collection.count_documents({"post_id": post_id})
-    
-    return ForumPost(
-        id=post["_id"],
-        title=post["title"],
-        content=post["content"],
-        category=post["category"],
-        tags=post.get("tags", []),
-        author_id=post["author_id"],
-        author_name=author_name,
-        replies_count=replies_count,
-        views=post.get("views", 0) + 1,
-        created_at=post["created_at"],
-        updated_at=post.get("updated_at", post["created_at"]),
-        last_activity=post.get("last_activity", post["created_at"]),
-        author_profile_photo=author_photo
-    )
+    post_views.add(post_id, viewer_key(request, credentials))
+    post["views"] += 1
+    return FastJSONResponse(forum_post_row(post))
 
 @app.post("/api/forum/posts")
 async def create_forum_post(
@@ -1562,18 +1906,18 @@ async def create_forum_post(
         "category": post_data.category,
         "tags": post_data.tags,
         "author_id": current_user.id,
+        "author": author_snapshot(current_user.model_dump()),
+        "replies_count": 0,
         "views": 0,
         "created_at": now,
         "updated_at": now,
         "last_activity": now
     }
     
-    forum_posts_collection.insert_one(post_doc)
+    await forum_posts_collection.insert_one(post_doc)
     
-    # Award achievement for first post
-    user_post_count = forum_posts_collection.count_documents({"author_id": current_user.id})
-    if user_post_count == 1:
-        await check_and_award_achievement(current_user.id, "forum_contributor")
+    await bump_user_stats(current_user.id, forum_posts=1)
+    achievement_engine.emit(current_user.id, "forum_post")
     
     return {"message": "Post created successfully", "id": post_id}
 
@@ -1584,7 +1928,7 @@ async def update_forum_post(
     current_user: User = Depends(get_current_user)
 ):
     """Update a forum post (author or admin only)"""
-    post = forum_posts_collection.find_one({"_id": post_id})
+    post = await forum_posts_collection.find_one({"_id": post_id})
     
     if not post:
         raise HTTPException(
@@ -1610,7 +1954,7 @@ async def update_forum_post(
     if post_data.tags is not None:
         update_fields["tags"] = post_data.tags
     
-    forum_posts_collection.update_one(
+    await forum_posts_collection.update_one(
         {"_id": post_id},
         {"$set": update_fields}
     )
@@ -1623,7 +1967,7 @@ async def delete_forum_post(
     current_user: User = Depends(get_current_user)
 ):
     """Delete a forum post (author or admin only)"""
-    post = forum_posts_collection.find_one({"_id": post_id})
+    post = await forum_posts_collection.find_one({"_id": post_id})
     
     if not post:
         raise HTTPException(
@@ -1639,10 +1983,12 @@ async def delete_forum_post(
         )
     
     # Delete all replies first
-    forum_replies_collection.delete_many({"post_id": post_id})
+    await forum_replies_collection.delete_many({"post_id": post_id})
     
     # Delete the post
-    forum_posts_collection.delete_one({"_id": post_id})
+    result = await forum_posts_collection.delete_one({"_id": post_id})
+    if result.deleted_count:
+        await bump_user_stats(post["author_id"], forum_posts=-1)
     
     return {"message": "Post deleted successfully"}
 
@@ -1650,7 +1996,7 @@ async def delete_forum_post(
 async def get_post_replies(post_id: str):
     """Get all replies for a post"""
     # Check if post exists
-    post = forum_posts_collection.find_one({"_id": post_id})
+    post = await forum_posts_collection.find_one({"_id": post_id})
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1658,9 +2004,9 @@ async def get_post_replies(post_id: str):
         )
     
     replies = []
-    for reply in forum_replies_collection.find({"post_id": post_id}).sort("created_at", 1):
-        # Get author details
-        author = users_collection.find_one({"_id": reply["author_id"]})
+    async for reply in forum_replies_collection.find({"post_id": post_id}).sort("created_at", 1):
+        # Author snapshot is denormalized onto the reply
+        author = reply.get("author")
         author_name = author["name"] if author else "Unknown User"
         author_photo = author.get("profile_photo") if author else None
         
@@ -1684,7 +2030,7 @@ async def create_reply(
 ):
     """Create a reply to a forum post"""
     # Check if post exists
-    post = forum_posts_collection.find_one({"_id": post_id})
+    post = await forum_posts_collection.find_one({"_id": post_id})
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1698,16 +2044,17 @@ async def create_reply(
         "_id": reply_id,
         "post_id": post_id,
         "author_id": current_user.id,
+        "author": author_snapshot(current_user.model_dump()),
         "content": reply_data.content,
         "created_at": now
     }
     
-    forum_replies_collection.insert_one(reply_doc)
+    await forum_replies_collection.insert_one(reply_doc)
     
-    # Update post's last activity
-    forum_posts_collection.update_one(
+    # Update post's last activity and reply counter
+    await forum_posts_collection.update_one(
         {"_id": post_id},
-        {"$set": {"last_activity": now}}
+        {"$set": {"last_activity": now}, "$inc": {"replies_count": 1}}
     )
     
     return {"message": "Reply created successfully", "id": reply_id}
@@ -1718,7 +2065,7 @@ async def delete_reply(
     current_user: User = Depends(get_current_user)
 ):
     """Delete a forum reply (author or admin only)"""
-    reply = forum_replies_collection.find_one({"_id": reply_id})
+    reply = await forum_replies_collection.find_one({"_id": reply_id})
     
     if not reply:
         raise HTTPException(
@@ -1733,10 +2080,67 @@ async def delete_reply(
             detail="Not enough permissions"
         )
     
-    forum_replies_collection.delete_one({"_id": reply_id})
+    result = await forum_replies_collection.delete_one({"_id": reply_id})
+    
+    # Only decrement if we were the request that actually removed it
+    if result.deleted_count:
+        await forum_posts_collection.update_one(
+            {"_id": reply["post_id"]},
+            {"$inc": {"replies_count": -1}}
+        )
     
     return {"message": "Reply deleted successfully"}
 
+## Admin endpoints
+@app.get("/api/admin/indexes")
+async def get_index_report(current_user: User = Depends(get_current_admin_user)):
+    """Declared vs existing indexes per collection, with missing/unused lists"""
+    return {
+        "schema_version": await current_version(db),
+        "collections": await index_report(db)
+    }
+
+@app.get("/api/admin/user-cache")
+async def get_user_cache_stats(current_user: User = Depends(get_current_admin_user)):
+    """This worker's auth cache size and hit/miss counters"""
+    return user_cache.stats()
+
+@app.get("/api/admin/password-hashing")
+async def get_password_hashing_stats(current_user: User = Depends(get_current_admin_user)):
+    """This worker's bcrypt pool load and rejected (429) count"""
+    return password_hasher.stats()
+
+@app.post("/api/admin/password-hashing/calibrate")
+async def recalibrate_password_hashing(current_user: User = Depends(get_current_admin_user)):
+    """Re-measure the bcrypt cost on this machine and store it for every worker"""
+    return {"rounds": await password_hasher.load_rounds(db, recalibrate=True)}
+
+@app.get("/api/admin/blobs")
+async def get_blob_report(current_user: User = Depends(get_current_admin_user)):
+    """Deduplicated upload storage - blobs, bytes on disk and bytes referenced"""
+    return await blob_report(db)
+
+@app.post("/api/admin/forum/reconcile")
+async def reconcile_forum_counters(current_user: User = Depends(get_current_admin_user)):
+    """Repair reply counters and author snapshots that drifted from forum_replies/users"""
+    return await reconcile_forum(db)
+
+@app.post("/api/admin/user-stats/reconcile")
+async def reconcile_user_counters(current_user: User = Depends(get_current_admin_user)):
+    """Rebuild per-user profile counters from the source collections"""
+    return await reconcile_user_stats(db)
+
+@app.post("/api/admin/stats/reconcile")
+async def reconcile_stats_counters(current_user: User = Depends(get_current_admin_user)):
+    """Reset the /api/stats counters to the real collection sizes"""
+    stats_cache["stats"] = None
+    return await reconcile_site_counters(db)
+
+@app.post("/api/admin/achievements/recompute")
+async def recompute_user_achievements(current_user: User = Depends(get_current_admin_user)):
+    """Award every achievement users qualify for but don't hold yet"""
+    return await recompute_achievements(db)
+
 ## Health check endpoints
 @app.get("/")
 async def root():
@@ -1746,11 +2150,30 @@ async def root():
 async def health_check():
     try:
         # Ping DB to verify connection
-        client.admin.command('ping')
+        await ping()
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
 
+async def reconcile_counters():
+    """Repair every denormalized counter from its source collection"""
+    await reconcile_forum(db)
+    await reconcile_user_stats(db)
+    await reconcile_site_counters(db)
+    stats_cache["stats"] = None
+
+# Background loops started on startup and cancelled on shutdown
+background_tasks = []
+
+async def run_periodically(interval, job, name):
+    """Run `job()` every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await job()
+        except Exception as e:
+            print(f"⚠️  {name} failed: {e}")
+
 # Startup event to initialize backup system
 @app.on_event("startup")
 async def startup_event():
@@ -1758,6 +2181,53 @@ async def startup_event():
     import subprocess
     import threading
     
+    await verify_database()
+    
+    # Bring indexes up to date before serving traffic
+    try:
+        await run_migrations(db)
+    except Exception as e:
+        print(f"⚠️  Index migration failed: {e}")
+    
+    if RECONCILE_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(
+            run_periodically(RECONCILE_INTERVAL, reconcile_counters, "Counter reconcile")
+        ))
+    
+    try:
+        await password_hasher.load_rounds(db)
+    except Exception as e:
+        print(f"⚠️  bcrypt calibration failed, using the default cost: {e}")
+    
+    try:
+        await build_search_index()
+    except Exception as e:
+        print(f"⚠️  Search index build failed: {e}")
+    if SEARCH_REBUILD_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(
+            run_periodically(SEARCH_REBUILD_INTERVAL, build_search_index, "Search index rebuild")
+        ))
+    background_tasks.append(asyncio.create_task(
+        run_periodically(DOWNLOAD_FLUSH_INTERVAL, download_buffer.flush, "Download flush")
+    ))
+    background_tasks.append(asyncio.create_task(
+        run_periodically(VIEW_FLUSH_INTERVAL, post_views.flush, "View flush")
+    ))
+    background_tasks.append(asyncio.create_task(
+        run_periodically(ACHIEVEMENT_INTERVAL, achievement_engine.process, "Achievement pass")
+    ))
+    background_tasks.append(asyncio.create_task(
+        run_periodically(USER_CACHE_POLL_INTERVAL, user_cache.poll, "Auth cache invalidation poll")
+    ))
+    background_tasks.append(asyncio.create_task(
+        run_periodically(UPLOAD_SESSION_GC_INTERVAL, collect_expired, "Upload session cleanup")
+    ))
+    background_tasks.append(asyncio.create_task(
+        run_periodically(BCRYPT_SETTINGS_REFRESH, lambda: password_hasher.load_rounds(db), "bcrypt cost refresh")
+    ))
+    # Resumes where the last run stopped - only unclaimed uploads are parsed
+    background_tasks.append(asyncio.create_task(backfill_resource_text()))
+    
     def run_continuous_backup():
         """Run backup system in background thread"""
         try:
@@ -1776,6 +2246,20 @@ async def startup_event():
     
     print("✓ Startup complete - data protection active")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered writes, stop background loops and close the Mongo connection pool"""
+    await download_buffer.close()
+    await post_views.close()
+    # Last, so events from the final download flush are evaluated too
+    await achievement_engine.close()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    shutdown_pool()
+    password_hasher.shutdown()
+    client.close()
+
 # Run the server (supervisor handles this in production)
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,284 @@
+"""
+PDF text extraction for uploaded papers, notes and syllabus.
+Parsing runs in a process pool so it never holds the event loop or the GIL;
+the text is split into per-page chunks stored in resource_chunks, and its
+most frequent terms (search_index.body_terms) into resource_terms for the
+search index - so building the index never re-reads or re-tokenizes PDF text.
+
+Progress lives on the resource doc itself (text_status), so a backfill that
+is interrupted - or runs on several workers at once - picks up where it left
+off: every job first claims its doc, and a claim older than CLAIM_TIMEOUT
+is considered abandoned.
+
+A PDF that takes longer than EXTRACT_TIMEOUT, or a worker process dying
+(e.g. OOM-killed on a huge scan), replaces the pool and puts the doc back
+to pending; each claim counts an attempt and the doc is only marked failed
+once EXTRACT_MAX_ATTEMPTS are used up. A PDF the parser rejects is failed
+straight away.
+"""
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pypdf import PdfReader
+from pymongo import ReturnDocument
+from search_index import body_terms
+
+# Worker processes parsing PDFs (also the backfill's parallelism)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "2"))
+CHUNK_WORDS = 200
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# Seconds one PDF may spend in the parser before its worker is killed
+EXTRACT_TIMEOUT = int(os.getenv("EXTRACT_TIMEOUT", "120"))
+EXTRACT_MAX_ATTEMPTS = int(os.getenv("EXTRACT_MAX_ATTEMPTS", "3"))
+
+RESOURCE_TYPES = {"paper": "papers", "note": "notes", "syllabus": "syllabus"}
+
+_pool = None
+
+
+def extract_pages(file_path):
+    """Text of every page of a PDF (runs inside a worker process)"""
+    reader = PdfReader(file_path)
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+def extract_document(file_path):
+    """(page texts, body terms) of a PDF - tokenizing here keeps it off the event loop's GIL"""
+    pages = extract_pages(file_path)
+    return pages, body_terms(" ".join(pages))
+
+
+def chunk_pages(pages, size=CHUNK_WORDS):
+    """Split page texts into chunks of at most `size` words; returns [(page, text)]"""
+    chunks = []
+    for page_number, text in enumerate(pages, start=1):
+        words = text.split()
+        for start in range(0, len(words), size):
+            chunks.append((page_number, " ".join(words[start:start + size])))
+    return chunks
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork - forking a process that runs Motor's threads is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def replace_pool(pool):
+    """Drop a broken or stuck pool, killing its workers; the next get_pool() starts
+    a fresh one. Jobs still running on it fail with BrokenProcessPool and go back
+    to pending."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    # A worker stuck in the parser never returns on its own - shutdown alone won't stop it
+    for process in list((pool._processes or {}).values()):
+        process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def claimable(now):
+    """Filter for resources whose text still needs extracting"""
+    return {"$or": [
+        {"text_status": {"$exists": False}},
+        {"text_status": "pending"},
+        {"text_status": "processing", "text_claimed_at": {"$lt": now - CLAIM_TIMEOUT}},
+    ]}
+
+
+async def claim(collection, resource_id=None):
+    """Atomically mark one resource (or the given one) as being processed; returns it or None"""
+    now = datetime.utcnow()
+    query = claimable(now)
+    if resource_id is not None:
+        query["_id"] = resource_id
+    return await collection.find_one_and_update(
+        query,
+        {"$set": {"text_status": "processing", "text_claimed_at": now}, "$inc": {"text_attempts": 1}},
+        projection={"file_path": 1, "text_attempts": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def release_claim(collection, doc, error):
+    """Put a doc whose extraction didn't finish back to pending, or fail it once
+    it has used up its attempts"""
+    if doc.get("text_attempts", 1) < EXTRACT_MAX_ATTEMPTS:
+        update = {"$set": {"text_status": "pending"}, "$unset": {"text_claimed_at": ""}}
+    else:
+        update = {"$set": {
+            "text_status": "failed",
+            "text_error": f"Gave up after {EXTRACT_MAX_ATTEMPTS} attempts: {error}"[:500]
+        }}
+    await collection.update_one({"_id": doc["_id"], "text_status": "processing"}, update)
+
+
+async def extract_resource(db, resource_type, doc):
+    """Extract and store the chunks and body terms of one claimed resource;
+    returns the body terms or None"""
+    collection = db[RESOURCE_TYPES[resource_type]]
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    try:
+        pages, terms = await asyncio.wait_for(
+            loop.run_in_executor(pool, extract_document, doc["file_path"]),
+            EXTRACT_TIMEOUT
+        )
+    except BrokenProcessPool:
+        # Some job on this pool killed its worker - not necessarily this one
+        replace_pool(pool)
+        await release_claim(collection, doc, "worker process died")
+        print(f"⚠️  Text extraction pool broke while parsing {resource_type} {doc['_id']}, restarted it")
+        return None
+    except asyncio.TimeoutError:
+        replace_pool(pool)
+        await release_claim(collection, doc, f"timed out after {EXTRACT_TIMEOUT}s")
+        print(f"⚠️  Text extraction timed out for {resource_type} {doc['_id']}, restarted the pool")
+        return None
+    except Exception as e:
+        await collection.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"text_status": "failed", "text_error": str(e)[:500]}}
+        )
+        print(f"⚠️  Text extraction failed for {resource_type} {doc['_id']}: {e}")
+        return None
+
+    chunks = chunk_pages(pages)
+    await db.resource_chunks.delete_many({"resource_type": resource_type, "resource_id": doc["_id"]})
+    if chunks:
+        await db.resource_chunks.insert_many([
+            {
+                "_id": f"{resource_type}:{doc['_id']}:{n}",
+                "resource_type": resource_type,
+                "resource_id": doc["_id"],
+                "chunk": n,
+                "page": page,
+                "text": text,
+            }
+            for n, (page, text) in enumerate(chunks)
+        ], ordered=False)
+    await db.resource_terms.replace_one(
+        {"_id": f"{resource_type}:{doc['_id']}"},
+        {
+            "resource_type": resource_type,
+            "resource_id": doc["_id"],
+            "terms": terms,
+            "updated_at": datetime.utcnow(),
+        },
+        upsert=True
+    )
+
+    result = await collection.update_one(
+        {"_id": doc["_id"]},
+        {"$set": {"text_status": "done", "text_chunks": len(chunks)}, "$unset": {"text_claimed_at": "", "text_error": ""}}
+    )
+    if result.matched_count == 0:
+        # Resource deleted while we were parsing it
+        await delete_extracted(db, resource_type, doc["_id"])
+        return None
+    return terms
+
+
+async def delete_extracted(db, resource_type, resource_id):
+    """Drop a resource's chunks and body terms"""
+    await db.resource_chunks.delete_many({"resource_type": resource_type, "resource_id": resource_id})
+    await db.resource_terms.delete_one({"_id": f"{resource_type}:{resource_id}"})
+
+
+async def backfill(db, on_extracted=None, workers=EXTRACT_WORKERS):
+    """Extract every resource without text, `workers` at a time; returns docs processed"""
+    processed = 0
+
+    async def worker(resource_type):
+        nonlocal processed
+        collection = db[RESOURCE_TYPES[resource_type]]
+        while True:
+            doc = await claim(collection)
+            if doc is None:
+                return
+            terms = await extract_resource(db, resource_type, doc)
+            processed += 1
+            if terms is not None and on_extracted:
+                await on_extracted(resource_type, doc["_id"], terms)
+
+    for resource_type in RESOURCE_TYPES:
+        await asyncio.gather(*(worker(resource_type) for _ in range(workers)))
+    if processed:
+        print(f"✓ Extracted text from {processed} uploaded PDFs")
+    return processed
+
+
+async def retry_pool_failures(db):
+    """Give docs failed by an earlier crashed pool (they have no attempt count) another go"""
+    reset = 0
+    for collection_name in RESOURCE_TYPES.values():
+        result = await db[collection_name].update_many(
+            {"text_status": "failed", "text_attempts": {"$exists": False}},
+            {"$set": {"text_status": "pending"}, "$unset": {"text_error": "", "text_claimed_at": ""}}
+        )
+        reset += result.modified_count
+    if reset:
+        print(f"✓ Queued {reset} failed PDFs for another extraction attempt")
+    return reset
+
+
+async def load_body_terms(db, since=None):
+    """Body terms per resource as {(resource_type, resource_id): {term: count}},
+    only those stored at or after `since` if given"""
+    query = {} if since is None else {"updated_at": {"$gte": since}}
+    return {
+        (doc["resource_type"], doc["resource_id"]): doc["terms"]
+        async for doc in db.resource_terms.find(query, {"resource_type": 1, "resource_id": 1, "terms": 1})
+    }
+
+
+async def backfill_body_terms(db):
+    """Compute resource_terms from the chunks of PDFs extracted before it existed,
+    one resource at a time in (type, id, chunk) index order"""
+    stored = 0
+    key, texts = None, []
+
+    async def store():
+        nonlocal stored
+        if key is None:
+            return
+        await db.resource_terms.replace_one(
+            {"_id": f"{key[0]}:{key[1]}"},
+            {
+                "resource_type": key[0],
+                "resource_id": key[1],
+                "terms": body_terms(" ".join(texts)),
+                "updated_at": datetime.utcnow(),
+            },
+            upsert=True
+        )
+        stored += 1
+
+    cursor = db.resource_chunks.find({}, {"resource_type": 1, "resource_id": 1, "text": 1}).sort(
+        [("resource_type", 1), ("resource_id", 1), ("chunk", 1)]
+    )
+    async for chunk in cursor:
+        chunk_key = (chunk["resource_type"], chunk["resource_id"])
+        if chunk_key != key:
+            await store()
+            key, texts = chunk_key, []
+        texts.append(chunk["text"])
+    await store()
+    if stored:
+        print(f"✓ Stored search terms for {stored} extracted PDFs")
+    return stored
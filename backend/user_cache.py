@@ -0,0 +1,96 @@
+"""
+Per-worker TTL + LRU cache of the user docs get_current_user resolves, so
+an authenticated request doesn't pay a users find_one round trip.
+
+Workers don't share memory, so an invalidation is both applied locally and
+published to the user_cache_invalidations collection; every worker polls
+that collection every USER_CACHE_POLL_INTERVAL seconds and evicts the users
+listed. Writers outside the API (make_admin.py, init_db.py) publish there
+too. USER_CACHE_TTL caps how stale an entry can get if a publish is missed.
+"""
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_POLL_INTERVAL = float(os.getenv("USER_CACHE_POLL_INTERVAL", "2"))
+# Slack on the poll window for clock skew between workers
+CLOCK_SKEW = timedelta(seconds=5)
+
+# Only what the User model needs - never cache the password hash
+USER_PROJECTION = {
+    "name": 1,
+    "email": 1,
+    "usn": 1,
+    "course": 1,
+    "semester": 1,
+    "is_admin": 1,
+    "profile_photo": 1,
+}
+
+
+class UserCache:
+    def __init__(self, users, invalidations, ttl=USER_CACHE_TTL, max_size=USER_CACHE_SIZE):
+        self.users = users
+        self.invalidations = invalidations
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()   # user_id -> (expires_at, user doc), least recently used first
+        self._generation = 0            # bumped on every eviction
+        self._polled_at = datetime.utcnow()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    async def get(self, user_id):
+        """The user doc for `user_id` (None if there is no such user)"""
+        entry = self._entries.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        generation = self._generation
+        user = await self.users.find_one({"_id": user_id}, USER_PROJECTION)
+        # An invalidation that landed during the find may have raced it - don't cache
+        if user and generation == self._generation:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return user
+
+    def evict(self, user_id):
+        self._generation += 1
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidated += 1
+
+    async def invalidate(self, user_id):
+        """Evict `user_id` here and tell the other workers to do the same"""
+        self.evict(user_id)
+        await self.invalidations.insert_one({"user_id": user_id, "at": datetime.utcnow()})
+
+    async def poll(self):
+        """Apply invalidations published since the last poll"""
+        started = datetime.utcnow()
+        async for row in self.invalidations.find(
+            {"at": {"$gte": self._polled_at - CLOCK_SKEW}},
+            {"user_id": 1}
+        ):
+            self.evict(row["user_id"])
+        self._polled_at = started
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "invalidated": self.invalidated,
+        }
@@ -0,0 +1,153 @@
+"""
+Buffered forum view counter. Views are coalesced in memory per post id and
+written with one bulk_write of $inc ops every VIEW_FLUSH_INTERVAL seconds,
+or sooner once VIEW_MAX_PENDING views are waiting. Those two settings bound
+how many views a crashed worker can lose.
+
+Reads add the views still waiting in this worker to the stored count, so a
+post's count never goes backwards for clients of the same worker.
+
+Each view also feeds a HyperLogLog sketch of the viewer. On flush the
+worker's sketch is merged into the post's stored viewer_sketch and the
+estimate saved as unique_viewers, all in one bulk_write. A sketch_version
+guard makes concurrent flushes from other workers retry instead of
+overwriting each other. The merge runs under its own lock, so reads only
+wait for the views write.
+"""
+import os
+import uuid
+import asyncio
+from bson import Binary
+from pymongo import UpdateOne
+from hyperloglog import HyperLogLog
+
+VIEW_FLUSH_INTERVAL = float(os.getenv("VIEW_FLUSH_INTERVAL", "10"))
+VIEW_MAX_PENDING = int(os.getenv("VIEW_MAX_PENDING", "1000"))
+
+
+class ViewCounter:
+    def __init__(self, collection, max_pending=VIEW_MAX_PENDING):
+        self.collection = collection
+        self.max_pending = max_pending
+        self._pending = {}      # post_id -> views not yet written
+        self._viewers = {}      # post_id -> HyperLogLog of viewers not yet merged
+        self._total = 0
+        self._epoch = 0         # bumped whenever a flush takes the pending views
+        self._lock = asyncio.Lock()           # held while the views are written
+        self._sketch_lock = asyncio.Lock()    # held while the sketches are merged
+        self._flush_task = None
+
+    def pending(self, post_id):
+        return self._pending.get(post_id, 0)
+
+    def add(self, post_id, viewer=None):
+        self._pending[post_id] = self._pending.get(post_id, 0) + 1
+        if viewer:
+            self._viewers.setdefault(post_id, HyperLogLog()).add(viewer)
+        self._total += 1
+        if self._total >= self.max_pending and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self.flush())
+            self._flush_task.add_done_callback(lambda _: setattr(self, "_flush_task", None))
+
+    async def fetch_consistent(self, fetch):
+        """Run `fetch()` so that pending() can be added to the views it returns.
+        Retried if a flush overlapped the fetch, since the docs may or may not
+        include the views that flush was writing."""
+        while True:
+            if self._lock.locked():
+                async with self._lock:
+                    pass
+            epoch = self._epoch
+            result = await fetch()
+            if epoch == self._epoch and not self._lock.locked():
+                return result
+
+    async def read(self, post_id, fetch):
+        """Run `fetch()` for the post and add its buffered views to doc["views"]"""
+        doc = await self.fetch_consistent(fetch)
+        if doc:
+            doc["views"] = doc.get("views", 0) + self.pending(post_id)
+        return doc
+
+    async def flush(self):
+        """Write all buffered views in one bulk_write, then merge viewer sketches;
+        returns posts whose views were updated"""
+        updated = await self._flush_views()
+        async with self._sketch_lock:
+            await self._merge_viewers()
+        return updated
+
+    async def _flush_views(self):
+        async with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending, self._total = self._pending, {}, 0
+            self._epoch += 1
+            try:
+                await self.collection.bulk_write([
+                    UpdateOne({"_id": post_id}, {"$inc": {"views": views}})
+                    for post_id, views in batch.items()
+                ], ordered=False)
+            except BaseException as e:
+                # Merge back so the views go out with the next flush
+                for post_id, views in batch.items():
+                    self._pending[post_id] = self._pending.get(post_id, 0) + views
+                    self._total += views
+                if not isinstance(e, Exception):
+                    raise
+                print(f"⚠️  View flush failed, {self._total} views buffered: {e}")
+                return 0
+            return len(batch)
+
+    async def _merge_viewers(self):
+        """Fold this worker's viewer sketches into the stored ones"""
+        sketches, self._viewers = self._viewers, {}
+        if not sketches:
+            return
+        # Tags this flush's writes, to tell which guarded updates matched
+        token = uuid.uuid4().hex
+        saved = set()
+        try:
+            found, updates = [], []
+            async for post in self.collection.find(
+                {"_id": {"$in": list(sketches)}},
+                {"viewer_sketch": 1, "sketch_version": 1}
+            ):
+                found.append(post["_id"])
+                sketch = sketches[post["_id"]]
+                if post.get("viewer_sketch"):
+                    sketch.merge(HyperLogLog(post["viewer_sketch"]))
+                # Only write if nobody else merged since we read it
+                updates.append(UpdateOne(
+                    {"_id": post["_id"], "sketch_version": post.get("sketch_version")},
+                    {
+                        "$set": {
+                            "viewer_sketch": Binary(sketch.to_bytes()),
+                            "unique_viewers": sketch.count(),
+                            "sketch_token": token
+                        },
+                        "$inc": {"sketch_version": 1}
+                    }
+                ))
+            # Posts not found were deleted - nothing to keep
+            saved = set(sketches) - set(found)
+            if updates:
+                result = await self.collection.bulk_write(updates, ordered=False)
+                if result.matched_count == len(updates):
+                    saved.update(found)
+                else:
+                    async for post in self.collection.find(
+                        {"_id": {"$in": found}, "sketch_token": token}, {"_id": 1}
+                    ):
+                        saved.add(post["_id"])
+        except Exception as e:
+            print(f"⚠️  Viewer sketch flush failed: {e}")
+        # Lost a race or failed - merged sketches stay correct, so retry next flush
+        for post_id, sketch in sketches.items():
+            if post_id not in saved:
+                self._viewers.setdefault(post_id, HyperLogLog()).merge(sketch)
+
+    async def close(self):
+        if self._flush_task:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
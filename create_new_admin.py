@@ -36,6 +36,8 @@ if existing_admin:
         {"email": admin_email},
         {"$set": {"is_admin": True}}
     )
+    # Running API workers drop their cached copy of this user
+    db.user_cache_invalidations.insert_one({"user_id": existing_admin["_id"], "at": datetime.utcnow()})
     print(f"✓ Ensured admin privileges for: {admin_email}")
 else:
     # Create new admin user